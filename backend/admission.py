@@ -0,0 +1,155 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException
+
+import metrics
+
+
+class AdmissionController:
+    """Caps concurrent upstream calls behind a bounded wait queue with deadlines and per-user quotas.
+
+    Requests beyond max_concurrent wait in a queue of at most max_queue; when
+    the queue is full they are rejected at once with 429. A request that
+    can't get a slot within queue_timeout is rejected with 503. When
+    user_quota is set, each username may start that many requests per
+    quota_window seconds.
+    """
+
+    def __init__(self, max_concurrent=8, max_queue=32, queue_timeout=10.0, request_timeout=60.0,
+                 user_quota=0, quota_window=60.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.user_quota = user_quota
+        self.quota_window = quota_window
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._user_requests = defaultdict(deque)
+        self._wait_times = deque(maxlen=1024)
+        self.waiting = 0
+        self.active = 0
+        self.admitted = 0
+        self.rejected = {'queue_full': 0, 'queue_timeout': 0, 'user_quota': 0}
+        self.deadline_exceeded = 0
+        self.max_wait = 0.0
+
+    def _reject(self, reason, status_code, detail, retry_after):
+        self.rejected[reason] += 1
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+
+    def _quota_retry_after(self, user, now):
+        """Seconds until the user may start another request, or 0 if under quota"""
+        if not user or not self.user_quota:
+            return 0
+        requests = self._user_requests[user]
+        while requests and requests[0] <= now - self.quota_window:
+            requests.popleft()
+        if not requests:
+            del self._user_requests[user]
+            return 0
+        if len(requests) < self.user_quota:
+            return 0
+        return max(1, int(requests[0] + self.quota_window - now + 1))
+
+    def check(self, user=None):
+        """Reject immediately if the request could not be queued, without taking a slot"""
+        retry_after = self._quota_retry_after(user, time.monotonic())
+        if retry_after:
+            self._reject('user_quota', 429, "Request quota exceeded. Try again later.", retry_after)
+        if self.waiting >= self.max_queue and self._semaphore.locked():
+            self._reject('queue_full', 429, "Too many AI requests in progress. Try again shortly.", 1)
+
+    def charge(self, user):
+        """Count one request against the user's quota, rejecting it with 429 if the quota is used up"""
+        if not user or not self.user_quota:
+            return
+        now = time.monotonic()
+        retry_after = self._quota_retry_after(user, now)
+        if retry_after:
+            self._reject('user_quota', 429, "Request quota exceeded. Try again later.", retry_after)
+        self._user_requests[user].append(now)
+
+    @asynccontextmanager
+    async def slot(self, user=None):
+        """Hold one upstream slot; yields the deadline (loop time) the call must finish by.
+
+        user is charged against its quota here; calls shared by several users
+        (coalesced flights) charge each caller with charge() and pass no user.
+        """
+        self.charge(user)
+        self.check()
+        now = time.monotonic()
+
+        self.waiting += 1
+        try:
+            if self._semaphore.locked():
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            else:
+                # A free slot is taken without suspending, so the next check() sees it as used
+                await self._semaphore.acquire()
+        except asyncio.TimeoutError:
+            self._reject('queue_timeout', 503, "AI service is busy. Try again shortly.", int(self.queue_timeout) or 1)
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - now
+        metrics.observe_stage('admission_wait', waited)
+        self._wait_times.append(waited)
+        self.max_wait = max(self.max_wait, waited)
+        self.admitted += 1
+        self.active += 1
+        try:
+            yield asyncio.get_running_loop().time() + self.request_timeout
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    async def call(self, factory, user=None):
+        """Run factory() inside a slot, bounded by the request deadline"""
+        async with self.slot(user) as deadline:
+            try:
+                return await asyncio.wait_for(factory(), timeout=deadline - asyncio.get_running_loop().time())
+            except asyncio.TimeoutError:
+                self.deadline_exceeded += 1
+                raise HTTPException(status_code=504, detail="AI request deadline exceeded.")
+
+    def stats(self):
+        waits = sorted(self._wait_times)
+
+        def percentile(fraction):
+            return round(waits[min(len(waits) - 1, int(len(waits) * fraction))] * 1000, 1) if waits else 0.0
+
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'active': self.active,
+            'queue_depth': self.waiting,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+            'deadline_exceeded': self.deadline_exceeded,
+            'wait_ms': {
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'max': round(self.max_wait * 1000, 1)
+            }
+        }
+
+
+class RateLimiter:
+    """Spaces call starts evenly so at most `rate` begin per `per` seconds; rate 0 disables it"""
+
+    def __init__(self, rate, per=60.0):
+        self.interval = per / rate if rate > 0 else 0.0
+        self._next_start = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        start = max(now, self._next_start)
+        self._next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
@@ -1,9 +1,18 @@
 from openai import AsyncOpenAI
-from pymongo import MongoClient
 import dotenv
 import os
 import asyncio
+import time
 from fastapi import HTTPException
+from http_client import OPENROUTER_BASE_URL, create_http_client
+from answer_cache import AnswerCache
+from cache import normalize_query
+from singleflight import SingleFlight
+from conversation_store import ConversationStore, estimate_text_tokens
+from admission import AdmissionController
+from search_index import BM25Index, tokenize
+from database import get_async_database
+import metrics
 
 # Load .env file
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -22,66 +31,163 @@ else:
     print(f"OPENROUTER_API_KEY loaded successfully: {OPENROUTER_API_KEY[:4]}...")
     try:
         ai_client = AsyncOpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=OPENROUTER_API_KEY
+            base_url=OPENROUTER_BASE_URL,
+            api_key=OPENROUTER_API_KEY,
+            http_client=create_http_client()
         )
     except Exception as e:
         print(f"Error initializing OpenAI client: {e}")
         ai_client = None
 
-# MongoDB setup
-MONGODB_URL = os.getenv('MONGODB_URL', 'mongodb://localhost:27017/')
-client = MongoClient(MONGODB_URL)
-db = client.get_database("rulebox_f1_database")
-rules_collection = db["rules"]
+# MongoDB: the process-wide Motor pool; indexes are set up by the app at startup
+async_rules_collection = get_async_database()["rules"]
+
+# Conversation history: bounded in memory, or in Mongo with CONVERSATION_STORE=mongodb
+CONVERSATION_STORE = os.getenv('CONVERSATION_STORE', 'memory').lower()
+CONVERSATION_MAX = int(os.getenv('CONVERSATION_MAX', '1000'))
+CONVERSATION_MAX_BYTES = int(os.getenv('CONVERSATION_MAX_BYTES', str(16 * 1024 * 1024)))
+CONVERSATION_IDLE_TTL = int(os.getenv('CONVERSATION_IDLE_TTL', '3600'))
+CONVERSATION_TOKEN_BUDGET = int(os.getenv('CONVERSATION_TOKEN_BUDGET', '3000'))
+
+conversation_collection = None
+if CONVERSATION_STORE in ('mongo', 'mongodb'):
+    conversation_collection = get_async_database()["conversations"]
+
+conversation_store = ConversationStore(
+    max_conversations=CONVERSATION_MAX,
+    max_bytes=CONVERSATION_MAX_BYTES,
+    idle_ttl=CONVERSATION_IDLE_TTL,
+    token_budget=CONVERSATION_TOKEN_BUDGET,
+    collection=conversation_collection
+)
+
+AI_MODEL = "deepseek/deepseek-r1"  # DeepSeek R1 model
+
+# Prompt context: up to AI_CONTEXT_CANDIDATES text-search hits packed into the token budget.
+# The default matches the old three 100-character snippets (~100 tokens); raise it for fuller context
+AI_CONTEXT_TOKEN_BUDGET = int(os.getenv('AI_CONTEXT_TOKEN_BUDGET', '100'))
+AI_CONTEXT_CANDIDATES = int(os.getenv('AI_CONTEXT_CANDIDATES', '8'))
+AI_CONTEXT_MIN_CHUNK_TOKENS = 48
+
+# Persistent cache of answers to context-free (no conversation_id) queries
+AI_CACHE_PATH = os.getenv('AI_CACHE_PATH', os.path.join(os.path.dirname(__file__), 'ai_answer_cache.sqlite3'))
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', '86400'))
+AI_CACHE_MAX_ENTRIES = int(os.getenv('AI_CACHE_MAX_ENTRIES', '5000'))
 
-# Create index if needed
 try:
-    existing_indexes = rules_collection.index_information()
-    if not any("text" in index.get("key", [{}])[0] for index in existing_indexes.values()):
-        print("Creating text index...")
-        rules_collection.create_index(
-            [("title", "text"), ("content", "text")],
-            name="rules_text_index"
-        )
-        print("Index created.")
-    else:
-        print("Text index already exists.")
+    answer_cache = AnswerCache(AI_CACHE_PATH, ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX_ENTRIES)
 except Exception as e:
-    print(f"Index error: {e}")
+    print(f"Error opening AI answer cache: {e}")
+    answer_cache = None
 
-# In-memory conversation history
-conversation_history = {}
+# Identical concurrent context-free queries share one retrieval and LLM call
+ai_flight = SingleFlight()
 
-# Main AI query function
-async def ai_query(query, context_rules=None, conversation_id=None):
-    if not ai_client:
-        raise HTTPException(status_code=503, detail="AI features unavailable. Check OpenRouter API key.")
+# Batch questions: size cap, model calls in flight per batch, and shared $text pool size
+AI_BATCH_MAX_QUERIES = int(os.getenv('AI_BATCH_MAX_QUERIES', '200'))
+AI_BATCH_CONCURRENCY = int(os.getenv('AI_BATCH_CONCURRENCY', '8'))
+AI_BATCH_POOL_LIMIT = 500
+
+# Upstream LLM concurrency limit, wait queue, deadlines and optional per-user quota
+AI_MAX_CONCURRENT = int(os.getenv('AI_MAX_CONCURRENT', '8'))
+AI_MAX_QUEUE = int(os.getenv('AI_MAX_QUEUE', '32'))
+AI_QUEUE_TIMEOUT = float(os.getenv('AI_QUEUE_TIMEOUT', '10'))
+AI_REQUEST_TIMEOUT = float(os.getenv('AI_REQUEST_TIMEOUT', '60'))
+AI_USER_QUOTA = int(os.getenv('AI_USER_QUOTA', '0'))  # requests per AI_QUOTA_WINDOW, 0 disables
+AI_QUOTA_WINDOW = float(os.getenv('AI_QUOTA_WINDOW', '60'))
 
+ai_admission = AdmissionController(
+    max_concurrent=AI_MAX_CONCURRENT,
+    max_queue=AI_MAX_QUEUE,
+    queue_timeout=AI_QUEUE_TIMEOUT,
+    request_timeout=AI_REQUEST_TIMEOUT,
+    user_quota=AI_USER_QUOTA,
+    quota_window=AI_QUOTA_WINDOW
+)
+
+
+async def _retrieve_context(query, context_rules):
+    """Candidate rules for the prompt, best text-score match first"""
+    # Search context if not provided
+    if context_rules:
+        return context_rules
     try:
-        # Previous messages
-        messages = []
-        if conversation_id and conversation_id in conversation_history:
-            messages = conversation_history[conversation_id]
+        with metrics.stage("context_retrieval"):
+            return await async_rules_collection.find(
+                {"$text": {"$search": query}},
+                {"score": {"$meta": "textScore"}, "metadata.embedding": 0}
+            ).sort([("score", {"$meta": "textScore"})]).limit(AI_CONTEXT_CANDIDATES).to_list(length=AI_CONTEXT_CANDIDATES)
+    except Exception as e:
+        print(f"Context retrieval error: {e}")
+        return []
 
-        # Search context if not provided
-        if not context_rules:
-            context_rules = list(rules_collection.find({"$text": {"$search": query}}).limit(3))
 
-        has_context = bool(context_rules)
+def _pack_context(context_rules, token_budget=None):
+    """Pack whole rules, in rank order, into the prompt token budget.
 
-        # Build system message
-        if has_context:
-            context = ""
-            for rule in context_rules[:3]:
-                context += f"- {rule.get('title', '')}: {rule.get('content', '')[:100]}...\n"
-            system_message = f"""You are a world-class Formula 1 expert AI. Use the regulation context below if helpful, but rely primarily on your own expert knowledge.
+    Rules whose content repeats an already packed rule (same rule_id, same text,
+    or text contained in a packed article) are skipped. A rule that no longer
+    fits is replaced by its stored AI summary if it has one, otherwise cut at a
+    sentence boundary if enough budget is left.
+    Returns (packed_rules, context_text).
+    """
+    budget = AI_CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    packed = []
+    lines = []
+    seen_ids = set()
+    seen_contents = []
+    for rule in context_rules:
+        content = ' '.join((rule.get('content') or '').split())
+        rule_id = rule.get('rule_id')
+        if not content or (rule_id is not None and rule_id in seen_ids):
+            continue
+        lowered = content.lower()
+        if any(lowered in previous for previous in seen_contents):
+            continue
+        line = f"- Article {rule.get('article_number', '')} {rule.get('title', '')}: {content}\n"
+        cost = estimate_text_tokens(line)
+        if cost > budget and rule.get('ai_summary'):
+            # A precomputed summary (see generate_ai_summaries) beats a cut-off article
+            line = f"- Article {rule.get('article_number', '')} {rule.get('title', '')} (summary): {rule['ai_summary']}\n"
+            cost = estimate_text_tokens(line)
+        if cost > budget:
+            if budget < AI_CONTEXT_MIN_CHUNK_TOKENS:
+                break
+            cut = line[:budget * 4]
+            sentence_end = cut.rfind('. ')
+            line = (cut[:sentence_end + 1] if sentence_end > len(cut) // 2 else cut) + "...\n"
+            cost = budget
+        packed.append(rule)
+        lines.append(line)
+        seen_ids.add(rule_id)
+        seen_contents.append(lowered)
+        budget -= cost
+        if budget <= 0:
+            break
+    return packed, ''.join(lines)
+
+
+def _cache_key(query, context_rules, conversation_id):
+    """Answer cache key, or None when the query is conversational or caching is off"""
+    if conversation_id or not answer_cache or not answer_cache.enabled:
+        return None
+    return answer_cache.make_key(query, AI_MODEL, context_rules)
+
+
+def _prepare_messages(query, context, history):
+    """Build the chat messages for a query, continuing the conversation's history if any"""
+    # Previous messages
+    messages = list(history)
+
+    # Build system message
+    if context:
+        system_message = f"""You are a world-class Formula 1 expert AI. Use the regulation context below if helpful, but rely primarily on your own expert knowledge.
 
 Regulation Context:
 {context}
 """
-        else:
-            system_message = """You are a world-class Formula 1 expert. You MUST answer all questions using your own extensive F1 knowledge.
+    else:
+        system_message = """You are a world-class Formula 1 expert. You MUST answer all questions using your own extensive F1 knowledge.
 
 NEVER say "context is missing" — you know all F1 rules, procedures, teams, and penalties.
 
@@ -90,30 +196,253 @@ Q: What does a black flag mean?
 A: A black flag means the driver is disqualified and must return to the pits immediately. It is used for serious infractions or dangerous driving.
 """
 
-        # Build chat messages
-        if not messages:
-            messages.append({"role": "system", "content": system_message})
-        messages.append({"role": "user", "content": query})
+    # Build chat messages
+    if not messages:
+        messages.append({"role": "system", "content": system_message})
+    messages.append({"role": "user", "content": query})
+    return messages
 
-        response = await ai_client.chat.completions.create(
-            model="deepseek/deepseek-r1",  # DeepSeek R1 model
-            messages=messages[-2],
-            max_tokens=50,  
-            temperature=0.1
-        )
 
-        # Validate response structure
-        if not response or not response.choices:
-            raise HTTPException(status_code=500, detail="Invalid response from AI client.")
+async def _remember(conversation_id, messages, ai_response, user=None):
+    # Update history; the store trims it to the token budget
+    messages.append({"role": "assistant", "content": ai_response})
+    await conversation_store.save(conversation_id, messages, user=user)
 
-        ai_response = response.choices[0].message.content
 
-        # Update history
-        messages.append({"role": "assistant", "content": ai_response})
-        if conversation_id:
-            conversation_history[conversation_id] = messages[-10:]
+# Main AI query function
+async def ai_query(query, context_rules=None, conversation_id=None, user=None):
+    with metrics.stage("ai_query"):
+        if not conversation_id and not context_rules:
+            # Each caller is charged its own quota before joining; the shared call is charged to no one,
+            # so one user's quota rejection never reaches another user coalesced onto the same flight
+            ai_admission.charge(user)
+            return await ai_flight.do((normalize_query(query), AI_MODEL), lambda: _ai_query(query, None, None))
+        return await _ai_query(query, context_rules, conversation_id, user)
 
-        return {"response": ai_response}
 
+async def _ai_query(query, context_rules, conversation_id, user=None):
+    if not ai_client:
+        raise HTTPException(status_code=503, detail="AI features unavailable. Check OpenRouter API key.")
+
+    try:
+        with metrics.stage("conversation_load"):
+            history = await conversation_store.get(conversation_id, user=user)
+        # Regulation context only goes into the system prompt that opens a conversation
+        packed_rules, context = [], ""
+        if not history:
+            context_rules = await _retrieve_context(query, context_rules)
+            with metrics.stage("context_packing"):
+                packed_rules, context = _pack_context(context_rules)
+        return await _answer(query, packed_rules, context, history, conversation_id, user)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI query error: {e}")
+
+
+async def _answer(query, packed_rules, context, history, conversation_id, user):
+    """Answer from the cache or the model once context has been retrieved and packed"""
+    cache_key = _cache_key(query, packed_rules, conversation_id)
+    if cache_key:
+        with metrics.stage("answer_cache"):
+            cached = answer_cache.get(cache_key)
+        metrics.cache_result("answers", cached is not None)
+        if cached is not None:
+            return {"response": cached, "cached": True}
+
+    messages = _prepare_messages(query, context, history)
+
+    async def call_model():
+        # Timed inside the admission slot so queueing shows up separately as admission_wait
+        with metrics.stage("llm_call"):
+            return await ai_client.chat.completions.create(
+                model=AI_MODEL,
+                messages=messages,
+                max_tokens=50,
+                temperature=0.1
+            )
+
+    response = await ai_admission.call(call_model, user=user)
+
+    # Validate response structure
+    if not response or not response.choices:
+        raise HTTPException(status_code=500, detail="Invalid response from AI client.")
+
+    ai_response = response.choices[0].message.content
+
+    with metrics.stage("conversation_save"):
+        await _remember(conversation_id, messages, ai_response, user)
+    if cache_key and ai_response:
+        answer_cache.put(cache_key, ai_response)
+
+    return {"response": ai_response, "cached": False}
+
+
+async def _retrieve_context_batch(queries, search_index=None):
+    """Candidate context rules for many queries, with at most one Mongo round trip.
+
+    With the in-memory search index each query is ranked against it directly.
+    Otherwise a single $text search over all query terms fetches a shared pool
+    of rules, which is then ranked per query with a BM25 index over the pool.
+    The search is built from plain tokens, so $text phrase quotes or negations
+    in one question can't narrow the pool for the others.
+    """
+    if search_index is None or not len(search_index):
+        limit = min(AI_CONTEXT_CANDIDATES * len(queries), AI_BATCH_POOL_LIMIT)
+        terms = dict.fromkeys(term for query in queries for term in tokenize(query))
+        pool = []
+        try:
+            if terms:
+                with metrics.stage("context_retrieval_batch"):
+                    pool = await async_rules_collection.find(
+                        {"$text": {"$search": " ".join(terms)}},
+                        {"score": {"$meta": "textScore"}, "metadata.embedding": 0}
+                    ).sort([("score", {"$meta": "textScore"})]).limit(limit).to_list(length=limit)
+        except Exception as e:
+            print(f"Batch context retrieval error: {e}")
+        search_index = BM25Index.from_rules(pool)
+    return {query: search_index.search(query, AI_CONTEXT_CANDIDATES) for query in queries}
+
+
+async def ai_query_batch(queries, search_index=None, user=None):
+    """Answer many context-free queries concurrently, yielding one event per input query as answers complete.
+
+    Duplicate queries (after normalization) are answered once, context is
+    retrieved for the whole batch up front, and at most AI_BATCH_CONCURRENCY
+    model calls run at a time. Events are {"type": "result", ...} or
+    {"type": "error", ...} per query, then a final {"type": "done", ...}.
+    """
+    started = time.perf_counter()
+    groups = {}
+    for index, query in enumerate(queries):
+        groups.setdefault(normalize_query(query), []).append(index)
+    unique = [queries[indexes[0]] for indexes in groups.values()]
+
+    if not ai_client:
+        for index, query in enumerate(queries):
+            yield {"type": "error", "index": index, "query": query, "status": 503,
+                   "detail": "AI features unavailable. Check OpenRouter API key."}
+        yield {"type": "done", "total": len(queries), "unique": len(unique), "errors": len(queries), "total_ms": 0.0}
+        return
+
+    candidates = await _retrieve_context_batch(unique, search_index)
+    limiter = asyncio.Semaphore(AI_BATCH_CONCURRENCY)
+
+    async def answer(query):
+        async with limiter:
+            try:
+                packed_rules, context = _pack_context(candidates[query])
+                # Coalesce with identical single queries already in flight, charging the quota per caller
+                ai_admission.charge(user)
+                result = await ai_flight.do(
+                    (normalize_query(query), AI_MODEL),
+                    lambda: _answer(query, packed_rules, context, [], None, None)
+                )
+                return query, {"type": "result", **result}
+            except HTTPException as e:
+                return query, {"type": "error", "status": e.status_code, "detail": e.detail}
+            except Exception as e:
+                return query, {"type": "error", "status": 500, "detail": f"AI query error: {e}"}
+
+    tasks = [asyncio.ensure_future(answer(query)) for query in unique]
+    errors = 0
+    try:
+        for completed in asyncio.as_completed(tasks):
+            query, event = await completed
+            for index in groups[normalize_query(query)]:
+                errors += event["type"] == "error"
+                yield dict(event, index=index, query=queries[index])
+    finally:
+        # The client went away or the batch failed: drop queued questions and stop
+        # model calls no other caller is waiting on (SingleFlight cancels those)
+        for task in tasks:
+            task.cancel()
+
+    total_ms = round((time.perf_counter() - started) * 1000, 1)
+    print(f"AI batch completed: queries={len(queries)} unique={len(unique)} total_ms={total_ms}")
+    yield {"type": "done", "total": len(queries), "unique": len(unique), "errors": errors, "total_ms": total_ms}
+
+
+async def ai_query_stream(query, context_rules=None, conversation_id=None, user=None):
+    """Stream an answer as events: a "token" event per chunk, then "done" with timings, or "error".
+
+    Cached answers to context-free queries are replayed as a single token.
+    """
+    if not ai_client:
+        yield {"type": "error", "detail": "AI features unavailable. Check OpenRouter API key."}
+        return
+
+    started = time.perf_counter()
+    first_token_at = None
+    parts = []
+    try:
+        with metrics.stage("conversation_load"):
+            history = await conversation_store.get(conversation_id, user=user)
+        # Regulation context only goes into the system prompt that opens a conversation
+        packed_rules, context = [], ""
+        if not history:
+            context_rules = await _retrieve_context(query, context_rules)
+            with metrics.stage("context_packing"):
+                packed_rules, context = _pack_context(context_rules)
+        cache_key = _cache_key(query, packed_rules, conversation_id)
+        cached = answer_cache.get(cache_key) if cache_key else None
+        if cache_key:
+            metrics.cache_result("answers", cached is not None)
+        if cached is not None:
+            total_ms = round((time.perf_counter() - started) * 1000, 1)
+            yield {"type": "token", "content": cached}
+            yield {"type": "done", "response": cached, "ttft_ms": total_ms, "total_ms": total_ms, "cached": True}
+            return
+
+        messages = _prepare_messages(query, context, history)
+        # The slot is held until the last token so streams count against the concurrency limit
+        async with ai_admission.slot(user) as deadline:
+            loop = asyncio.get_running_loop()
+            llm_started = time.perf_counter()
+            stream = await asyncio.wait_for(
+                ai_client.chat.completions.create(
+                    model=AI_MODEL,
+                    messages=messages,
+                    max_tokens=50,
+                    temperature=0.1,
+                    stream=True
+                ),
+                timeout=deadline - loop.time()
+            )
+            async for chunk in stream:
+                # Checked per chunk rather than with a timeout scope, which would
+                # cancel the consumer while it is suspended at a yield
+                if loop.time() > deadline:
+                    await stream.close()
+                    raise TimeoutError()
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if not content:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    metrics.observe_stage("llm_first_token", first_token_at - llm_started)
+                parts.append(content)
+                yield {"type": "token", "content": content}
+            metrics.observe_stage("llm_stream", time.perf_counter() - llm_started)
+    except HTTPException as e:
+        yield {"type": "error", "detail": e.detail, "status": e.status_code}
+        return
+    except TimeoutError:
+        ai_admission.deadline_exceeded += 1
+        yield {"type": "error", "detail": "AI request deadline exceeded.", "status": 504}
+        return
+    except Exception as e:
+        yield {"type": "error", "detail": f"AI query error: {e}"}
+        return
+
+    ai_response = "".join(parts)
+    await _remember(conversation_id, messages, ai_response, user)
+    if cache_key and ai_response:
+        answer_cache.put(cache_key, ai_response)
+    ttft_ms = round((first_token_at - started) * 1000, 1) if first_token_at else None
+    total_ms = round((time.perf_counter() - started) * 1000, 1)
+    print(f"AI stream completed: ttft_ms={ttft_ms} total_ms={total_ms}")
+    yield {"type": "done", "response": ai_response, "ttft_ms": ttft_ms, "total_ms": total_ms, "cached": False}
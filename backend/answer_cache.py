@@ -0,0 +1,92 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from cache import normalize_query
+
+
+class AnswerCache:
+    """Persistent SQLite cache of LLM answers with TTL and LRU eviction past max_entries"""
+
+    def __init__(self, path, ttl=86400, max_entries=5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL lets several uvicorn workers read the same file while one writes
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed)")
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def make_key(self, query, model, context_rules):
+        """Key on the normalized query, the model and the identity and version of each context rule"""
+        rules = sorted(
+            (rule.get('rule_id', str(rule.get('_id', ''))), (rule.get('metadata') or {}).get('content_hash', ''))
+            for rule in context_rules or []
+        )
+        payload = json.dumps([normalize_query(query), model, rules])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, created FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] + self.ttl < now:
+                if row is not None:
+                    self._connection.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._connection.execute("UPDATE answers SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO answers (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            excess = self._count() - self.max_entries
+            if excess > 0:
+                self._connection.execute(
+                    "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY accessed LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+
+    def _count(self):
+        return self._connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def invalidate(self):
+        """Drop every cached answer, e.g. after the rules corpus changes"""
+        with self._lock:
+            self._connection.execute("DELETE FROM answers")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': self._count(),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions
+            }
@@ -1,26 +1,61 @@
+import time
+
+# Startup time is measured from the moment this module starts importing
+IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from datacollect import RuleBoxF1Processor
-from ai_functions import ai_query
+from datacollect import RuleBoxF1Processor, MAX_INGEST_WORKERS
+from conversation_store import valid_conversation_id
+from ai_functions import (
+    ai_query, ai_query_stream, ai_query_batch, answer_cache, ai_flight, conversation_store, ai_admission,
+    AI_BATCH_MAX_QUERIES
+)
 import os
 import uvicorn
 from dotenv import load_dotenv
 from auth import AuthHandler
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import close_clients, ensure_indexes, get_async_client
+from collection_stats import read_collection_stats
+import metrics
+from profiler import (
+    PROFILER_INTERVAL_MS, PROFILER_MAX_PROFILES, PROFILER_MAX_SECONDS, PROFILER_SAMPLE_RATE,
+    ProfilerMiddleware, SamplingProfiler
+)
 import asyncio
-from pymongo import MongoClient
+import json
 
 load_dotenv()
 
-app = FastAPI()
+# Seconds between retries of the startup database check while Mongo is unreachable
+STARTUP_RETRY_SECONDS = float(os.getenv('STARTUP_RETRY_SECONDS', '5'))
+
+startup_state = {"ready": False, "startup_ms": None, "ready_ms": None, "indexes_ms": None, "error": None}
+
+def elapsed_ms(since):
+    return round((time.perf_counter() - since) * 1000, 1)
+
+@asynccontextmanager
+async def lifespan(app):
+    """Serve immediately; index setup and the data check run in the background"""
+    warm_up_task = asyncio.create_task(warm_up())
+    startup_state["startup_ms"] = elapsed_ms(IMPORT_STARTED)
+    print(f"RuleBox F1 API accepting requests after {startup_state['startup_ms']} ms")
+    yield
+    warm_up_task.cancel()
+    await shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add custom exception handler for HTTPException
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
-        content={"detail": exc.detail}
+        content={"detail": exc.detail},
+        headers=getattr(exc, "headers", None)
     )
 
 # Enable CORS
@@ -32,17 +67,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# MongoDB configuration
-MONGODB_URL = os.getenv('MONGODB_URL', 'mongodb://localhost:27017/')  # Changed from MONGODB_URI
-
-# Initialize MongoDB client
-db_client = AsyncIOMotorClient(MONGODB_URL)
+# Shared Motor connection pool (see database.py); creating it does no I/O
+db_client = get_async_client()
 
 # Initialize the RuleBoxF1Processor
-processor = RuleBoxF1Processor()
+processor = RuleBoxF1Processor(async_client=db_client)
 
 auth_handler = AuthHandler(db_client)
 
+# Samples PROFILER_SAMPLE_RATE of requests, plus any an admin sends with the profiler header
+profiler = SamplingProfiler(
+    interval=PROFILER_INTERVAL_MS / 1000,
+    max_profiles=PROFILER_MAX_PROFILES,
+    max_seconds=PROFILER_MAX_SECONDS,
+    sample_rate=PROFILER_SAMPLE_RATE
+)
+
+async def admin_scope(scope):
+    return await auth_handler.is_admin(request_username(Request(scope)))
+
+app.add_middleware(ProfilerMiddleware, profiler=profiler, authorize=admin_scope,
+                   skip_prefixes=("/api/profiles", "/metrics"))
+
+# Outermost, so request latency includes CORS handling and the whole streamed body
+app.add_middleware(metrics.MetricsMiddleware)
+
 @app.get("/")
 async def root():
     return {"message": "RuleBox F1 API is running"}
@@ -51,6 +100,11 @@ async def root():
 async def health():
     return {"status": "healthy", "message": "Backend is working"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once the database has answered the startup check, 503 before"""
+    return JSONResponse(status_code=200 if startup_state["ready"] else 503, content=startup_state)
+
 @app.get("/api/test-ai")
 async def test_ai():
     """Simple endpoint to test AI functionality"""
@@ -128,127 +182,333 @@ async def login(request: Request):
 # Add logging control flag at the top
 DEBUG_LOGGING = False  # Set to True only when debugging
 
+# Generate per-rule AI summaries after each ingest unless ?summarize=false
+AI_SUMMARIES_ON_INGEST = os.getenv('AI_SUMMARIES_ON_INGEST', 'false').lower() == 'true'
+
+# The background AI summary run; at most one at a time, polled via /api/summary-status
+summary_job = {"status": "idle", "started_at": None, "finished_at": None, "progress": {}, "result": None, "error": None}
+summary_task = None
+
+def start_summary_job():
+    """Start generating AI summaries in the background unless a run is already going"""
+    global summary_task
+    if summary_task is None or summary_task.done():
+        summary_job.update(status="running", started_at=time.time(), finished_at=None, progress={},
+                           result=None, error=None)
+        summary_task = asyncio.create_task(run_summary_job())
+    return dict(summary_job)
+
+async def run_summary_job():
+    try:
+        # Summary calls queue behind the same admission limits as interactive AI queries
+        result = await processor.generate_ai_summaries(admission=ai_admission, progress=summary_job["progress"])
+        summary_job.update(status="failed" if "error" in result else "completed", result=result,
+                           error=result.get("error"))
+    except Exception as e:
+        print(f"AI summary job failed: {e}")
+        summary_job.update(status="failed", error=str(e))
+    finally:
+        summary_job["finished_at"] = time.time()
+
 @app.post("/api/search")
 async def search(request: Request):
     try:
         data = await request.json()
         query = data.get("query")
+        category = data.get("category")
         if not query:
             raise HTTPException(status_code=400, detail="Query is required.")
         
         # Perform semantic search
-        results = processor.semantic_search(query, limit=10)
+        results = await processor.async_semantic_search(query, limit=10, category_filter=category)
         
         if not results:
             results = []
         
-        # Convert ObjectId to string for JSON serialization
-        serialized_results = []
-        for result in results:
-            if "_id" in result:
-                result["_id"] = str(result["_id"])
-            serialized_results.append(result)
+        # Convert ObjectId to string for JSON serialization; results may be
+        # shared with coalesced callers, so copy rather than mutate them
+        with metrics.stage("serialize"):
+            serialized_results = []
+            for result in results:
+                if "_id" in result:
+                    result = dict(result, _id=str(result["_id"]))
+                serialized_results.append(result)
+            response = JSONResponse(content={"results": serialized_results})
         
         # Suppress logging of search results
         if DEBUG_LOGGING:
             print(f"Search results: {serialized_results}")
         
-        return JSONResponse(content={"results": serialized_results})
+        return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
+def request_username(request: Request):
+    """Username from a valid Bearer token, or None for anonymous requests"""
+    authorization = request.headers.get("Authorization", "")
+    if not authorization.startswith("Bearer "):
+        return None
+    valid, username = auth_handler.verify_token(authorization[len("Bearer "):])
+    return username if valid else None
+
+async def read_json_body(request: Request):
+    """The request's JSON object body, rejected with 400 if it is malformed or not an object"""
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body must be valid JSON.")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON object.")
+    return data
+
+def read_conversation_id(data):
+    """The request's conversation_id, rejected with 400 unless it is a short id string"""
+    conversation_id = data.get("conversation_id")
+    if conversation_id is not None and not valid_conversation_id(conversation_id):
+        raise HTTPException(status_code=400, detail="conversation_id must be 1-64 letters, digits, '-' or '_'.")
+    return conversation_id
+
 @app.post("/api/ai-query")
 async def ai_query_endpoint(request: Request):
     try:
         data = await request.json()
         query = data.get("query")
-        conversation_id = data.get("conversation_id")
+        conversation_id = read_conversation_id(data)
         if not query:
             raise HTTPException(status_code=400, detail="Query is required.")
         
         # Use the simplified ai_query function with DeepSeek model
         try:
-            response = await ai_query(query, conversation_id=conversation_id)
+            response = await ai_query(query, conversation_id=conversation_id, user=request_username(request))
         except Exception as ai_error:
             if DEBUG_LOGGING:
                 print(f"AI function error: {str(ai_error)}")
             raise ai_error
         
         # Ensure the response is JSON serializable
-        if hasattr(response, '__dict__'):
-            response = response.__dict__
-        elif not isinstance(response, (str, int, float, bool, list, dict, type(None))):
-            response = str(response)
-        
-        return JSONResponse(content={"response": response})
+        with metrics.stage("serialize"):
+            if hasattr(response, '__dict__'):
+                response = response.__dict__
+            elif not isinstance(response, (str, int, float, bool, list, dict, type(None))):
+                response = str(response)
+            return JSONResponse(content={"response": response})
         
+    except HTTPException:
+        # Admission rejections keep their 429/503 status and Retry-After header
+        raise
     except Exception as e:
         if DEBUG_LOGGING:
             print(f"AI query error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI query failed: {str(e)}")
 
+@app.post("/api/ai-query/stream")
+async def ai_query_stream_endpoint(request: Request):
+    """Server-sent events variant of /api/ai-query that forwards tokens as they arrive"""
+    data = await read_json_body(request)
+    query = data.get("query")
+    conversation_id = read_conversation_id(data)
+    if not query:
+        raise HTTPException(status_code=400, detail="Query is required.")
+    user = request_username(request)
+    # Reject before the 200 response starts if the request can't even be queued
+    ai_admission.check(user)
+
+    async def events():
+        async for event in ai_query_stream(query, conversation_id=conversation_id, user=user):
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so nginx forwards each event immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/ai-query/batch")
+async def ai_query_batch_endpoint(request: Request):
+    """Answer a list of questions concurrently, streaming one NDJSON line per question as it completes"""
+    data = await read_json_body(request)
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q.strip() for q in queries):
+        raise HTTPException(status_code=400, detail="queries must be a non-empty list of strings.")
+    if len(queries) > AI_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {AI_BATCH_MAX_QUERIES} queries per batch.")
+
+    async def lines():
+        async for event in ai_query_batch(queries, search_index=processor.search_index, user=request_username(request)):
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+@app.get("/api/cache-stats")
+async def cache_stats():
+    return {
+        "search": processor.search_cache.stats(),
+        "answers": answer_cache.stats() if answer_cache else None,
+        "conversations": conversation_store.stats()
+    }
+
+@app.get("/api/admission-stats")
+async def admission_stats():
+    """Upstream AI concurrency, queue depth, wait times and rejections"""
+    return ai_admission.stats()
+
+@app.get("/api/coalescing-stats")
+async def coalescing_stats():
+    """How many identical concurrent requests were served by a single upstream call"""
+    return {"search": processor.search_flight.stats(), "ai_query": ai_flight.stats()}
+
+def runtime_metrics():
+    """Gauges and counters read from the existing stats objects at scrape time"""
+    admission = ai_admission.stats()
+    search_cache = processor.search_cache.stats()
+    yield ("rulebox_ready", "gauge", "1 once the startup database check has passed.",
+           [({}, int(startup_state["ready"]))])
+    yield ("rulebox_admission_active", "gauge", "AI calls currently holding an admission slot.",
+           [({}, admission["active"])])
+    yield ("rulebox_admission_queue_depth", "gauge", "AI calls waiting for an admission slot.",
+           [({}, admission["queue_depth"])])
+    yield ("rulebox_admission_rejected_total", "counter", "AI calls rejected by admission control.",
+           [({"reason": reason}, count) for reason, count in admission["rejected"].items()])
+    yield ("rulebox_admission_deadline_exceeded_total", "counter", "AI calls that ran past their deadline.",
+           [({}, admission["deadline_exceeded"])])
+    yield ("rulebox_search_cache_entries", "gauge", "Entries in the search result cache.",
+           [({}, search_cache["entries"])])
+    yield ("rulebox_coalesced_total", "counter", "Requests served by another identical in-flight call.",
+           [({"flight": "search"}, processor.search_flight.coalesced), ({"flight": "ai_query"}, ai_flight.coalesced)])
+
+metrics.REGISTRY.add_collector(runtime_metrics)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text exposition of request, stage and runtime metrics"""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+async def require_admin(request: Request):
+    username = request_username(request)
+    if not username:
+        raise HTTPException(status_code=401, detail="Authentication required.")
+    if not await auth_handler.is_admin(username):
+        raise HTTPException(status_code=403, detail="Admin access required.")
+    return username
+
+@app.get("/api/profiles")
+async def list_profiles(request: Request):
+    """Recent request profiles, newest first (admin only)"""
+    await require_admin(request)
+    return {"config": profiler.config(), "profiles": profiler.summaries()}
+
+@app.post("/api/profiles/config")
+async def configure_profiler(request: Request):
+    """Change the sampled fraction of requests at runtime, e.g. {"sample_rate": 0.01} (admin only)"""
+    await require_admin(request)
+    data = await request.json()
+    try:
+        sample_rate = float(data.get("sample_rate"))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="sample_rate must be a number between 0 and 1.")
+    if not 0 <= sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="sample_rate must be a number between 0 and 1.")
+    profiler.sample_rate = sample_rate
+    return profiler.config()
+
+@app.get("/api/profiles/folded")
+async def download_merged_profiles(request: Request, path: str = None):
+    """Every kept profile, or those for one path, merged into one folded-stack file (admin only)"""
+    await require_admin(request)
+    return PlainTextResponse(profiler.merged_folded(path))
+
+@app.get("/api/profiles/{profile_id}")
+async def download_profile(request: Request, profile_id: int):
+    """One profile as folded stacks for flamegraph.pl or speedscope (admin only)"""
+    await require_admin(request)
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found or no longer kept.")
+    return PlainTextResponse(
+        profile.folded(),
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'}
+    )
+
+def invalidate_answer_cache(result):
+    """Drop cached AI answers when an ingest run changed the rules corpus"""
+    store = result.get("store") or {}
+    if answer_cache and (store.get("inserted") or store.get("updated") or result.get("retired_rules")):
+        answer_cache.invalidate()
+
 @app.post("/api/ingest-data")
-async def ingest_data():
+async def ingest_data(workers: int = None, force: bool = False, summarize: bool = AI_SUMMARIES_ON_INGEST):
+    if workers is not None and not 1 <= workers <= MAX_INGEST_WORKERS:
+        raise HTTPException(status_code=400, detail=f"workers must be between 1 and {MAX_INGEST_WORKERS}.")
     try:
         loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, processor.process_documents)
+        result = await loop.run_in_executor(None, processor.process_documents, workers, force)
+        invalidate_answer_cache(result)
+        if summarize:
+            # Summaries take minutes to hours; poll /api/summary-status for progress
+            result["ai_summaries"] = start_summary_job()
         return JSONResponse(content={"message": "Data ingestion completed", "result": result})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Data ingestion failed: {str(e)}")
 
+@app.get("/api/summary-status")
+async def ai_summaries_status():
+    return summary_job
+
 @app.get("/api/data-status")
 async def data_status():
+    """Collection counts and the rules breakdown from the write-time summary; no collection scans"""
     try:
-        db = processor.db
-        collections_count = {}
-        collection_names = db.list_collection_names()
-        
-        for collection_name in collection_names:
-            count = db[collection_name].count_documents({})
-            collections_count[collection_name] = count
-            
-        return {
-            "collections": collections_count,
-            "total_documents": sum(collections_count.values()),
-        }
+        return await read_collection_stats(processor.async_db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get data status: {str(e)}")
 
-@app.on_event("startup")
-async def startup_event():
-    """Check if database has data and process raw_data if needed"""
-    try:
+# Bookkeeping and user data, which don't make the regulations database non-empty
+STARTUP_IGNORED_COLLECTIONS = ("summary", "ingest_manifest", "conversations", "users")
+
+async def count_documents():
+    """Documents in the regulation collections, from the same O(1) stats as /api/data-status"""
+    stats = await read_collection_stats(processor.async_db)
+    return sum(count for name, count in stats["collections"].items() if name not in STARTUP_IGNORED_COLLECTIONS)
+
+async def warm_up():
+    """Index setup and the database check, concurrently and off the request path"""
+    while True:
+        try:
+            started = time.perf_counter()
+            index_seconds, total_documents = await asyncio.gather(ensure_indexes(), count_documents())
+            break
+        except Exception as e:
+            startup_state["error"] = str(e)
+            print(f"Startup check failed, retrying in {STARTUP_RETRY_SECONDS}s: {e}")
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+
+    if index_seconds is not None:
+        startup_state["indexes_ms"] = round(index_seconds * 1000, 1)
+    startup_state.update(ready=True, error=None, ready_ms=elapsed_ms(IMPORT_STARTED))
+    print(f"RuleBox F1 API ready after {startup_state['ready_ms']} ms "
+          f"(database check {elapsed_ms(started)} ms, {total_documents} documents)")
+
+    # Only process if database is completely empty
+    if total_documents == 0:
         if DEBUG_LOGGING:
-            print("Starting up RuleBox F1 API...")
-        db = processor.db
-        collections = db.list_collection_names()
-        
-        # Check if we have any data
-        total_documents = 0
-        for collection_name in collections:
-            if collection_name not in ['system.indexes', 'summary']:
-                try:
-                    count = db[collection_name].count_documents({})
-                    total_documents += count
-                except:
-                    pass
-        
+            print("Database is empty. Will process raw_data folder in background...")
+        await process_data_in_background()
+    else:
         if DEBUG_LOGGING:
-            print(f"Found {total_documents} documents in database")
-        
-        # Only process if database is completely empty
-        if total_documents == 0:
-            if DEBUG_LOGGING:
-                print("Database is empty. Will process raw_data folder in background...")
-            # Don't await - let it run in background
-            asyncio.create_task(process_data_in_background())
-        else:
-            if DEBUG_LOGGING:
-                print(f"Database already contains {total_documents} documents - skipping data processing")
-            
-    except Exception as e:
-        if DEBUG_LOGGING:
-            print(f"Startup check failed: {e}")
+            print(f"Database already contains {total_documents} documents - skipping data processing")
+        await build_index_in_background()
+
+async def shutdown():
+    """Close pooled upstream HTTP connections and the shared database pools"""
+    if summary_task is not None:
+        summary_task.cancel()
+    from ai_functions import ai_client
+    if ai_client:
+        await ai_client.close()
+    if processor.ai_client:
+        await processor.ai_client.aclose()
+    close_clients()
 
 async def process_data_in_background():
     """Process data in background without blocking startup"""
@@ -257,11 +517,22 @@ async def process_data_in_background():
             print("Background processing started...")
         loop = asyncio.get_event_loop()
         result = await loop.run_in_executor(None, processor.process_documents)
+        invalidate_answer_cache(result)
+        if AI_SUMMARIES_ON_INGEST:
+            start_summary_job()
         if DEBUG_LOGGING:
             print(f"Background data processing completed: {result}")
     except Exception as e:
         if DEBUG_LOGGING:
             print(f"Background data processing failed: {e}")
 
+async def build_index_in_background():
+    """Build the in-memory search index from existing rules without blocking startup"""
+    try:
+        await processor.async_build_search_index()
+    except Exception as e:
+        if DEBUG_LOGGING:
+            print(f"Search index build failed: {e}")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -2,23 +2,74 @@ from datetime import datetime, timedelta
 from jose import jwt
 from passlib.context import CryptContext
 from motor.motor_asyncio import AsyncIOMotorClient
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
+import threading
+import time
 
 # JWT Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 
+# bcrypt runs in its own small thread pool so logins never stall the event loop
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "2"))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024"))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+class TokenCache:
+    """LRU of verified tokens to their username, each entry expiring with the token's exp claim"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token, username, expires_at):
+        with self._lock:
+            self._entries[token] = (username, expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
 class AuthHandler:
     def __init__(self, db_client):
         self.db = db_client
+        self._hash_pool = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="bcrypt")
+        # Callers beyond the pool size wait here rather than piling up in the executor queue
+        self._hash_slots = asyncio.Semaphore(AUTH_HASH_WORKERS)
+        self.token_cache = TokenCache(AUTH_TOKEN_CACHE_SIZE)
+
+    async def _run_hash(self, func, *args):
+        async with self._hash_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._hash_pool, func, *args)
 
     async def register_user(self, username: str, password: str, email: str):
         existing_user = await self.db.rulebox_f1.users.find_one({"username": username})
         if existing_user:
             return False, "Username already exists"
-        hashed_password = pwd_context.hash(password)
+        hashed_password = await self._run_hash(pwd_context.hash, password)
         user = {
             "username": username,
             "password": hashed_password,
@@ -30,7 +81,7 @@ class AuthHandler:
 
     async def authenticate_user(self, username: str, password: str):
         user = await self.db.rulebox_f1.users.find_one({"username": username})
-        if not user or not pwd_context.verify(password, user["password"]):
+        if not user or not await self._run_hash(pwd_context.verify, password, user["password"]):
             return False, "Invalid credentials"
         token = self.create_token({"username": username})
         return True, token
@@ -41,9 +92,21 @@ class AuthHandler:
         to_encode.update({"exp": expire})
         return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+    async def is_admin(self, username):
+        """Admin rights come from an operator-set is_admin flag on the user record, never from the name alone"""
+        if not username:
+            return False
+        user = await self.db.rulebox_f1.users.find_one({"username": username}, {"is_admin": 1})
+        return bool(user) and user.get("is_admin") is True
+
     def verify_token(self, token: str):
+        username = self.token_cache.get(token)
+        if username is not None:
+            return True, username
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            # jwt.decode has already rejected expired tokens; cache until exp
+            self.token_cache.put(token, payload["username"], float(payload["exp"]))
             return True, payload["username"]
         except Exception:
             return False, "Invalid token"
\ No newline at end of file
@@ -0,0 +1,259 @@
+"""Ingest benchmark: times each RuleBoxF1Processor stage on synthetic regulation corpora.
+
+Run from the backend directory:
+
+    python -m benchmarks.ingest --articles 400 --pages 120 --penalty-density 0.2 --output ingest.json
+    python -m benchmarks.ingest --compare ingest.json --tolerance 0.15
+
+Results are written as JSON. With --compare, any stage whose throughput drops
+more than --tolerance below the baseline is reported and the exit code is 1.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import textwrap
+import time
+
+from datacollect import RuleBoxF1Processor
+from rule_scanner import clean_text, extract_keywords, match_article_header, scan_features
+from benchmarks.memory_db import InMemoryDatabase
+
+TOPICS = [
+    'SAFETY CAR', 'VIRTUAL SAFETY CAR', 'PARC FERME', 'POWER UNIT', 'COST CAP', 'PIT STOP',
+    'QUALIFYING PROCEDURE', 'STARTING GRID', 'TYRE SUPPLY', 'AERODYNAMIC TESTING', 'SCRUTINEERING',
+    'FUEL SPECIFICATION', 'GEARBOX USAGE', 'SUSPENSION GEOMETRY', 'REPORTING OBLIGATIONS', 'EXCLUDED COSTS'
+]
+
+SENTENCES = [
+    'Each Competitor must ensure that its cars comply with these regulations at all times during the Event.',
+    'The stewards may investigate any incident reported by the race director or noted by the stewards.',
+    'Any change to the power unit components must be notified to the FIA technical delegate in writing.',
+    'Cars must remain under parc ferme conditions from the start of qualifying until the start of the race.',
+    'The safety car will be used to neutralise the race when competitors or officials are in danger.',
+    'Reporting documents must be submitted before the deadline set out in the financial regulations.',
+    'The team must provide full details of the suspension, brake and gearbox systems used in the car.'
+]
+
+PENALTIES = [
+    'A driver who fails to comply will receive a 5 second time penalty.',
+    'A breach of this article will result in a 10 place grid penalty for the next race.',
+    'The stewards may impose a drive through penalty or a stop and go penalty.',
+    'Repeated infringements may lead to disqualification from the results.',
+    'A first offence will be sanctioned with a reprimand.'
+]
+
+EXAMPLES = [
+    'Relevant costs include, for example, the manufacture of spare parts.',
+    'Safety equipment such as the halo and survival cell must be homologated.',
+    'Any documentation including the technical file must be retained.'
+]
+
+
+def generate_pages(articles, pages, penalty_density, seed=0):
+    """Build regulation-style text pages with numbered articles and sub-articles"""
+    rng = random.Random(seed)
+    lines = []
+    for number in range(1, articles + 1):
+        lines.append(f"ARTICLE {number} {TOPICS[number % len(TOPICS)]}")
+        for sub_number in range(1, rng.randint(2, 5) + 1):
+            sentences = rng.sample(SENTENCES, 2)
+            if rng.random() < penalty_density:
+                sentences.append(rng.choice(PENALTIES))
+            if rng.random() < penalty_density / 2:
+                sentences.append(rng.choice(EXAMPLES))
+            # Wrap like a typeset PDF so continuation lines become article content
+            lines.extend(textwrap.wrap(f"{number}.{sub_number} {' '.join(sentences)}", width=90))
+    per_page = max(1, -(-len(lines) // max(1, pages)))
+    return [
+        {'page_number': index + 1, 'text': '\n'.join(lines[start:start + per_page])}
+        for index, start in enumerate(range(0, len(lines), per_page))
+    ]
+
+
+def write_pdf(path, text_pages):
+    """Write pages as a minimal uncompressed PDF that PyPDF2 can extract text from"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    kids = []
+    for page in text_pages:
+        operations = ["BT /F1 9 Tf 11 TL 40 800 Td"]
+        for line in page['text'].split('\n'):
+            escaped = line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+            operations.append(f"({escaped}) Tj T*")
+        operations.append("ET")
+        stream = '\n'.join(operations).encode('latin-1', 'replace')
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects)
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    with open(path, 'wb') as file:
+        file.write(bytes(output))
+
+
+def article_bodies(text_pages):
+    """Split pages into (title, raw content) pairs the same way parse_regulations_structure does"""
+    articles = []
+    for page in text_pages:
+        for line in page['text'].split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+            header = match_article_header(line)
+            if header:
+                articles.append((header[1].strip(), []))
+            elif articles:
+                articles[-1][1].append(line)
+    return [(title, '\n'.join(content)) for title, content in articles]
+
+
+class Benchmark:
+    def __init__(self, repeat, mongo_url=None):
+        self.repeat = repeat
+        self.mongo_url = mongo_url
+        self.stages = {}
+
+    def fresh_database(self):
+        if not self.mongo_url:
+            return InMemoryDatabase()
+        from pymongo import MongoClient
+        client = MongoClient(self.mongo_url)
+        client.drop_database('rulebox_f1_benchmark')
+        return client['rulebox_f1_benchmark']
+
+    def time_stage(self, name, unit, items, run, setup=None):
+        """Run a stage `repeat` times and keep the fastest run"""
+        best = None
+        for _ in range(self.repeat):
+            state = setup() if setup else None
+            started = time.perf_counter()
+            run(state)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        self.stages[name] = {
+            'seconds': round(best, 6),
+            'items': items,
+            'unit': unit,
+            'per_second': round(items / best, 1) if best else None
+        }
+
+
+def run_benchmark(args):
+    text_pages = generate_pages(args.articles, args.pages, args.penalty_density, args.seed)
+    workdir = tempfile.mkdtemp(prefix='rulebox-bench-')
+    pdf_path = os.path.join(workdir, 'sporting_regulations.pdf')
+    write_pdf(pdf_path, text_pages)
+
+    processor = RuleBoxF1Processor(connect=False)
+    bench = Benchmark(args.repeat, args.mongo_url)
+
+    extracted = processor.extract_text_from_pdf(pdf_path)
+    bodies = article_bodies(extracted)
+    cleaned = [clean_text(content) for _, content in bodies]
+    lowered = [f"{title} {content}".lower() for (title, _), content in zip(bodies, cleaned)]
+    rules = processor.parse_regulations_structure(extracted, 'sporting')
+
+    bench.time_stage('extract', 'pages', len(extracted), lambda _: processor.extract_text_from_pdf(pdf_path))
+    bench.time_stage('clean', 'articles', len(bodies), lambda _: [clean_text(content) for _, content in bodies])
+    bench.time_stage('parse', 'rules', len(rules), lambda _: list(processor.iter_rules(extracted, 'sporting')))
+    bench.time_stage('keywords', 'articles', len(lowered), lambda _: [extract_keywords(text) for text in lowered])
+    bench.time_stage('penalties', 'articles', len(cleaned),
+                     lambda _: [scan_features(content, text) for content, text in zip(cleaned, lowered)])
+    bench.time_stage('embed', 'rules', len(rules), lambda _: processor._embed_rules(rules))
+
+    def store_setup():
+        processor.db = bench.fresh_database()
+        return processor
+
+    def store_noop_setup():
+        store_setup().store_in_database(rules)
+        return processor
+
+    bench.time_stage('store', 'rules', len(rules), lambda p: p.store_in_database(rules), store_setup)
+    bench.time_stage('store_unchanged', 'rules', len(rules), lambda p: p.store_in_database(rules), store_noop_setup)
+    bench.time_stage('end_to_end', 'rules', len(rules),
+                     lambda p: p.process_documents(workers=1, raw_data_folder=workdir), store_setup)
+
+    return {
+        'benchmark': 'ingest',
+        'config': {
+            'articles': args.articles,
+            'pages': args.pages,
+            'penalty_density': args.penalty_density,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'store': 'mongodb' if args.mongo_url else 'in-memory'
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'stages': bench.stages
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Return stages whose throughput fell more than `tolerance` below the baseline"""
+    regressions = []
+    for name, stage in report['stages'].items():
+        previous = baseline.get('stages', {}).get(name)
+        if not previous or not previous.get('per_second') or not stage.get('per_second'):
+            continue
+        change = stage['per_second'] / previous['per_second'] - 1
+        if change < -tolerance:
+            regressions.append({'stage': name, 'baseline': previous['per_second'],
+                                'current': stage['per_second'], 'change': round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--articles', type=int, default=300, help='number of top-level articles')
+    parser.add_argument('--pages', type=int, default=100, help='number of PDF pages')
+    parser.add_argument('--penalty-density', type=float, default=0.2, help='fraction of sub-articles with a penalty')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage; the fastest is reported')
+    parser.add_argument('--mongo-url', help='benchmark the store stages against this MongoDB instead of memory')
+    parser.add_argument('--output', help='write the JSON report to this file as well as stdout')
+    parser.add_argument('--compare', help='baseline JSON report to check for throughput regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed fractional throughput drop')
+    args = parser.parse_args()
+
+    # Processor progress output goes to stderr so stdout stays machine-readable
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run_benchmark(args)
+    if args.compare:
+        with open(args.compare) as file:
+            report['regressions'] = compare(report, json.load(file), args.tolerance)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    print(json.dumps(report, indent=2))
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Load generator for the AI endpoints: latency percentiles and throughput per concurrency level.
+
+Run from the backend directory against a running API, ideally one pointed at
+benchmarks.mock_openrouter so no API credits are spent:
+
+    python -m benchmarks.load_ai --url http://localhost:8000 --concurrency 1,4,16,64 --requests 200
+    python -m benchmarks.load_ai --endpoint /api/ai-query/stream --concurrency 8,32 --output load.json
+
+Each level runs a closed loop of --requests requests over that many
+concurrent workers. Queries are unique by default so the answer cache and
+request coalescing don't hide upstream cost; --distinct-queries N cycles
+through N questions instead.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+
+import httpx
+
+QUESTIONS = [
+    'What does a black flag mean?',
+    'When can the safety car be deployed?',
+    'What are parc ferme conditions?',
+    'How many power unit elements may a driver use?',
+    'What is the penalty for speeding in the pit lane?',
+    'What costs are excluded from the cost cap?'
+]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def make_query(index, distinct):
+    number = index % distinct if distinct else index
+    question = QUESTIONS[number % len(QUESTIONS)]
+    if distinct and number < len(QUESTIONS):
+        return question
+    return f"{question} (load {number})"
+
+
+async def timed_request(client, args, index):
+    """Return (status, latency seconds, time to first token or None)"""
+    payload = {"query": make_query(index, args.distinct_queries)}
+    started = time.perf_counter()
+    if args.endpoint.endswith('/stream'):
+        first_token = None
+        async with client.stream('POST', args.endpoint, json=payload) as response:
+            async for line in response.aiter_lines():
+                if first_token is None and line.startswith('event: token'):
+                    first_token = time.perf_counter() - started
+                if line.startswith('event: error'):
+                    return 'stream_error', time.perf_counter() - started, first_token
+        return response.status_code, time.perf_counter() - started, first_token
+    if args.method == 'GET':
+        response = await client.get(args.endpoint)
+    else:
+        response = await client.post(args.endpoint, json=payload)
+    return response.status_code, time.perf_counter() - started, None
+
+
+async def run_level(client, args, concurrency, offset):
+    next_index = iter(range(offset, offset + args.requests))
+    results = []
+
+    async def worker():
+        for index in next_index:
+            try:
+                results.append(await timed_request(client, args, index))
+            except httpx.HTTPError as e:
+                results.append((type(e).__name__, None, None))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for status, latency, _ in results if status == 200)
+    first_tokens = sorted(first for status, _, first in results if status == 200 and first is not None)
+    statuses = {}
+    for status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    level = {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'succeeded': len(latencies),
+        'statuses': statuses,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'p50': ms(percentile(latencies, 0.5)),
+            'p95': ms(percentile(latencies, 0.95)),
+            'p99': ms(percentile(latencies, 0.99)),
+            'max': ms(latencies[-1] if latencies else None)
+        }
+    }
+    if first_tokens:
+        level['ttft_ms'] = {
+            'p50': ms(percentile(first_tokens, 0.5)),
+            'p95': ms(percentile(first_tokens, 0.95)),
+            'p99': ms(percentile(first_tokens, 0.99))
+        }
+    return level
+
+
+async def run_load(args):
+    levels = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        for number, concurrency in enumerate(args.concurrency):
+            level = await run_level(client, args, concurrency, offset=number * args.requests)
+            print(f"concurrency={concurrency} rps={level['throughput_rps']} "
+                  f"p50={level['latency_ms']['p50']} p95={level['latency_ms']['p95']} "
+                  f"p99={level['latency_ms']['p99']} statuses={level['statuses']}", flush=True, file=args.log)
+            levels.append(level)
+    return {
+        'benchmark': 'load_ai',
+        'config': {
+            'url': args.url,
+            'endpoint': args.endpoint,
+            'requests_per_level': args.requests,
+            'distinct_queries': args.distinct_queries
+        },
+        'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+        'levels': levels
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8000', help='base URL of the RuleBox API')
+    parser.add_argument('--endpoint', default='/api/ai-query', help='/api/ai-query, /api/ai-query/stream or /api/test-ai')
+    parser.add_argument('--method', help='HTTP method; defaults to GET for /api/test-ai and POST otherwise')
+    parser.add_argument('--concurrency', default='1,4,16,64', help='comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=100, help='requests per concurrency level')
+    parser.add_argument('--distinct-queries', type=int, default=0, help='cycle through N queries; 0 makes every query unique')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--output', help='write the JSON report to this file as well as stdout')
+    args = parser.parse_args()
+    args.concurrency = [int(level) for level in args.concurrency.split(',') if level]
+    args.method = (args.method or ('GET' if args.endpoint.rstrip('/').endswith('test-ai') else 'POST')).upper()
+    # Progress lines go to stderr so stdout stays machine-readable
+    args.log = sys.stderr
+
+    report = asyncio.run(run_load(args))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
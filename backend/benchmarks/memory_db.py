@@ -0,0 +1,260 @@
+"""Minimal in-memory stand-in for the pymongo collections RuleBoxF1Processor writes to.
+
+Supports only the operations and query operators the ingest path uses, so the
+store stage can be benchmarked without a running MongoDB. Documents are keyed
+by _id with a unique index on rule_id, so the per-batch lookups and upserts
+cost the same whatever the collection size, as they do against Mongo's indexes.
+"""
+import itertools
+from types import SimpleNamespace
+
+# Fields with an equality index, as INDEX_SPECS gives rules.rule_id in Mongo
+INDEXED_FIELDS = ('rule_id',)
+
+
+def _copy(value):
+    """Copy of a BSON-like value, so stored and returned documents never share containers"""
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+def _get_path(document, path):
+    value = document
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _set_path(document, path, value):
+    *parents, field = path.split('.')
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[field] = value
+
+
+def _matches(document, query):
+    for field, condition in query.items():
+        value = _get_path(document, field)
+        if isinstance(condition, dict):
+            if '$in' in condition and value not in condition['$in']:
+                return False
+            if '$nin' in condition and value in condition['$nin']:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _project(document, projection):
+    """Apply a pymongo-style inclusion or exclusion projection, returning a copy"""
+    if not projection:
+        return _copy(document)
+    if any(projection.values()):
+        projected = {}
+        for path, include in projection.items():
+            value = _get_path(document, path)
+            if include and value is not None:
+                _set_path(projected, path, _copy(value))
+        if projection.get('_id', 1) and '_id' in document:
+            projected['_id'] = document['_id']
+        return projected
+    projected = _copy(document)
+    for path in projection:
+        *parents, field = path.split('.')
+        parent = _get_path(projected, '.'.join(parents)) if parents else projected
+        if isinstance(parent, dict):
+            parent.pop(field, None)
+    return projected
+
+
+class _BulkRecorder:
+    """Collects operations through the bulk protocol pymongo's own bulk_write drives them with"""
+
+    def __init__(self):
+        self.operations = []
+
+    def add_replace(self, selector, replacement, upsert=False, **kwargs):
+        self.operations.append(('replace', selector, replacement, upsert))
+
+    def add_update(self, selector, update, multi=False, upsert=False, **kwargs):
+        self.operations.append(('update', selector, update, upsert))
+
+    def add_insert(self, document):
+        self.operations.append(('insert', None, document, False))
+
+    def add_delete(self, selector, limit, **kwargs):
+        self.operations.append(('delete', selector, None, False))
+
+
+class InMemoryCollection:
+    def __init__(self):
+        self.documents = {}
+        self._indexes = {field: {} for field in INDEXED_FIELDS}
+        self._ids = itertools.count(1)
+
+    def create_index(self, *args, **kwargs):
+        return None
+
+    def _candidates(self, query):
+        """Documents that may match: an index lookup for _id or rule_id filters, otherwise all of them"""
+        for field in ('_id',) + INDEXED_FIELDS:
+            if field not in query:
+                continue
+            condition = query[field]
+            if isinstance(condition, dict):
+                if '$in' not in condition:
+                    continue
+                keys = condition['$in']
+            else:
+                keys = [condition]
+            if field == '_id':
+                ids = keys
+            else:
+                index = self._indexes[field]
+                ids = [index[key] for key in keys if key in index]
+            return [self.documents[_id] for _id in dict.fromkeys(ids) if _id in self.documents]
+        return list(self.documents.values())
+
+    def _matching(self, query):
+        query = query or {}
+        return [doc for doc in self._candidates(query) if _matches(doc, query)]
+
+    def _store(self, document):
+        previous = self.documents.get(document['_id'])
+        for field, index in self._indexes.items():
+            if previous is not None and previous.get(field) is not None:
+                index.pop(previous[field], None)
+            if document.get(field) is not None:
+                index[document[field]] = document['_id']
+        self.documents[document['_id']] = document
+
+    def _remove(self, document):
+        del self.documents[document['_id']]
+        for field, index in self._indexes.items():
+            if document.get(field) is not None:
+                index.pop(document[field], None)
+
+    def find(self, query=None, projection=None):
+        return [_project(doc, projection) for doc in self._matching(query)]
+
+    def find_one(self, query=None, projection=None):
+        found = self._matching(query)
+        return _project(found[0], projection) if found else None
+
+    def count_documents(self, query):
+        return len(self._matching(query))
+
+    def estimated_document_count(self):
+        return len(self.documents)
+
+    def _replace(self, query, replacement, upsert):
+        found = self._matching(query)
+        if found:
+            document = _copy(replacement)
+            document['_id'] = found[0]['_id']
+            self._store(document)
+            return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            document = _copy(replacement)
+            document.setdefault('_id', next(self._ids))
+            self._store(document)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=document['_id'])
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    def replace_one(self, query, replacement, upsert=False):
+        return self._replace(query, replacement, upsert)
+
+    def _update(self, query, update, upsert):
+        found = self._matching(query)
+        if found:
+            # Update a copy so _store can still see the old indexed values
+            document = _copy(found[0])
+            self._apply_update(document, update)
+            self._store(document)
+            return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            document = {key: value for key, value in query.items() if not isinstance(value, dict)}
+            document['_id'] = next(self._ids)
+            self._apply_update(document, update)
+            self._store(document)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=document['_id'])
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    def update_one(self, query, update, upsert=False):
+        return self._update(query, update, upsert)
+
+    @staticmethod
+    def _apply_update(doc, update):
+        for path, value in update.get('$set', {}).items():
+            _set_path(doc, path, _copy(value))
+        for path, delta in update.get('$inc', {}).items():
+            _set_path(doc, path, (_get_path(doc, path) or 0) + delta)
+
+    def bulk_write(self, operations, ordered=True):
+        recorder = _BulkRecorder()
+        for operation in operations:
+            operation._add_to_bulk(recorder)
+        upserted_ids = {}
+        inserted = modified = deleted = 0
+        for index, (kind, selector, document, upsert) in enumerate(recorder.operations):
+            if kind == 'insert':
+                document = _copy(document)
+                document.setdefault('_id', next(self._ids))
+                self._store(document)
+                inserted += 1
+                continue
+            if kind == 'delete':
+                deleted += self.delete_one(selector).deleted_count
+                continue
+            apply = self._replace if kind == 'replace' else self._update
+            result = apply(selector, document, upsert)
+            if result.upserted_id is not None:
+                upserted_ids[index] = result.upserted_id
+            modified += result.modified_count
+        return SimpleNamespace(
+            inserted_count=inserted, upserted_count=len(upserted_ids), upserted_ids=upserted_ids,
+            modified_count=modified, deleted_count=deleted
+        )
+
+    def delete_one(self, query):
+        found = self._matching(query)
+        if found:
+            self._remove(found[0])
+            return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+    def delete_many(self, query):
+        found = self._matching(query)
+        for doc in found:
+            self._remove(doc)
+        return SimpleNamespace(deleted_count=len(found))
+
+    def aggregate(self, pipeline):
+        # Only the single $group stage used by _create_summary_stats is supported
+        group = pipeline[0]['$group']
+        groups = {}
+        for doc in self.documents.values():
+            key = tuple((name, _get_path(doc, ref.lstrip('$'))) for name, ref in group['_id'].items())
+            groups[key] = groups.get(key, 0) + 1
+        return [{'_id': dict(key), 'count': count} for key, count in groups.items()]
+
+
+class InMemoryDatabase:
+    def __init__(self):
+        self._collections = {}
+
+    def __getitem__(self, name):
+        return self._collections.setdefault(name, InMemoryCollection())
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def list_collection_names(self):
+        return list(self._collections)
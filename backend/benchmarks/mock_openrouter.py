@@ -0,0 +1,149 @@
+"""Local OpenAI-compatible stand-in for OpenRouter, for load tests without API credits.
+
+Run from the backend directory, then point the API at it:
+
+    python -m benchmarks.mock_openrouter --port 8100 --latency 0.8 --tokens-per-second 40 --error-rate 0.02
+    OPENROUTER_BASE_URL=http://localhost:8100/v1 OPENROUTER_API_KEY=mock uvicorn app:app
+
+Emulates POST /v1/chat/completions with and without "stream": true. Each
+request waits --latency (plus up to --jitter) before the first token, then
+emits --response-tokens tokens at --tokens-per-second. A --error-rate
+fraction of requests fail with an OpenAI-style 429 or 500 error.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = [
+    'The', 'stewards', 'may', 'impose', 'a', 'time', 'penalty', 'on', 'any', 'driver', 'who',
+    'leaves', 'the', 'track', 'and', 'gains', 'a', 'lasting', 'advantage', 'under', 'the', 'safety', 'car'
+]
+
+
+class MockSettings:
+    def __init__(self, latency=0.5, jitter=0.1, tokens_per_second=50.0, response_tokens=40,
+                 error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+
+def create_app(settings=None):
+    settings = settings or MockSettings()
+    app = FastAPI(title="Mock OpenRouter")
+    app.state.settings = settings
+    app.state.requests = 0
+
+    def tokens(max_tokens):
+        count = min(settings.response_tokens, max_tokens or settings.response_tokens)
+        return [WORDS[index % len(WORDS)] + ' ' for index in range(count)]
+
+    def token_delay():
+        return 1.0 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0.0
+
+    def completion_id():
+        return f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "deepseek/deepseek-r1", "object": "model"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        model = body.get("model", "mock")
+        pieces = tokens(body.get("max_tokens"))
+
+        if settings.random.random() < settings.error_rate:
+            status_code = settings.random.choice([429, 500])
+            return JSONResponse(
+                status_code=status_code,
+                content={"error": {"message": "Mock upstream error", "type": "mock_error", "code": status_code}}
+            )
+
+        await asyncio.sleep(settings.latency + settings.random.uniform(0, settings.jitter))
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(token_delay() * len(pieces))
+            return {
+                "id": completion_id(),
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": ''.join(pieces).strip()},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(pieces), "total_tokens": len(pieces)}
+            }
+
+        async def events():
+            chunk_id = completion_id()
+            for index, piece in enumerate(pieces):
+                if index:
+                    await asyncio.sleep(token_delay())
+                chunk = {
+                    "id": chunk_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds before the first token')
+    parser.add_argument('--jitter', type=float, default=0.1, help='extra random latency, up to this many seconds')
+    parser.add_argument('--tokens-per-second', type=float, default=50.0, help='0 sends all tokens at once')
+    parser.add_argument('--response-tokens', type=int, default=40)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    import uvicorn
+    settings = MockSettings(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""Microbenchmark: compiled single-pass rule scanner vs. the original per-pattern extraction.
+
+Run from the backend directory:
+
+    python -m benchmarks.rule_scanner [--repeat 5] [--json]
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from datacollect import RuleBoxF1Processor
+from rule_scanner import match_article_header, scan_rule
+
+RAW_DATA_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'raw_data')
+
+# --- Original implementations, kept verbatim as the baseline -------------------------------
+
+LEGACY_ARTICLE_PATTERNS = [
+    r'\bARTICLE\s+(\d+(?:\.\d+)?)\s*[:\-–—]?\s*(.+?)(?=\n|\r|$)',
+    r'^(\d+(?:\.\d+)?)\s+(.+?)(?=\n|\r|$)',
+    r'\b(\d+(?:\.\d+)?)\s*\.\s*(.+?)(?=\n|\r|$)'
+]
+
+
+def legacy_header(line):
+    for pattern in LEGACY_ARTICLE_PATTERNS:
+        article_match = re.match(pattern, line, re.IGNORECASE)
+        if article_match:
+            return article_match.group(1), article_match.group(2)
+    return None
+
+
+def legacy_clean(text):
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'[^\w\s.,():\-–—/\[\]{}"]', '', text)
+    return text.strip()
+
+
+def legacy_keywords(text):
+    f1_terms = {
+        'aerodynamic', 'downforce', 'drs', 'power unit', 'ers', 'kers',
+        'qualifying', 'grid', 'safety car', 'pit stop', 'penalty',
+        'championship', 'points', 'constructor', 'driver', 'team',
+        'engine', 'gearbox', 'suspension', 'brake', 'tire', 'tyre',
+        'fuel', 'weight', 'ballast', 'scrutineering', 'parc ferme'
+    }
+    words = re.findall(r'\b[a-zA-Z]{3,}\b', text.lower())
+    word_freq = {}
+    for word in words:
+        if word in f1_terms or len(word) > 4:
+            word_freq[word] = word_freq.get(word, 0) + 1
+    sorted_keywords = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
+    return [word for word, freq in sorted_keywords[:10]]
+
+
+def legacy_penalties(content):
+    penalties = []
+    for pattern in [
+        r'(\d+)\s*second[s]?\s*time\s*penalty',
+        r'(\d+)\s*place[s]?\s*grid\s*penalty',
+        r'drive.through\s*penalty',
+        r'stop.and.go\s*penalty',
+        r'disqualification',
+        r'reprimand'
+    ]:
+        for match in re.finditer(pattern, content, re.IGNORECASE):
+            penalties.append(match.group(0))
+    return penalties
+
+
+def legacy_examples(content):
+    examples = []
+    for pattern in [
+        r'for example[,:]?\s*([^.]+\.)',
+        r'such as[,:]?\s*([^.]+\.)',
+        r'including[,:]?\s*([^.]+\.)'
+    ]:
+        for match in re.finditer(pattern, content, re.IGNORECASE):
+            examples.append(match.group(1).strip())
+    return examples[:3]
+
+
+def legacy_rule(title, content):
+    clean_content = legacy_clean(content)
+    return {
+        'title': legacy_clean(title),
+        'content': clean_content,
+        'keywords': legacy_keywords(f"{title} {clean_content}"),
+        'penalties': legacy_penalties(clean_content),
+        'examples': legacy_examples(clean_content)
+    }
+
+
+def scanner_rule(title, content):
+    scanned = scan_rule(title, content)
+    scanned.pop('lowered')
+    return scanned
+
+# --------------------------------------------------------------------------------------------
+
+
+def parse(text_pages, header_fn, rule_fn):
+    """The parse_regulations_structure loop with pluggable header matching and rule extraction"""
+    rules = []
+    current_article = None
+    current_content = []
+    for page_info in text_pages:
+        for line in page_info['text'].split('\n'):
+            line = line.strip()
+            if not line:
+                continue
+            header = header_fn(line)
+            if header:
+                if current_article:
+                    rules.append(rule_fn(current_article[1], '\n'.join(current_content)))
+                current_article = (header[0], header[1].strip())
+                current_content = []
+            elif current_article:
+                current_content.append(line)
+    if current_article:
+        rules.append(rule_fn(current_article[1], '\n'.join(current_content)))
+    return rules
+
+
+def load_corpus():
+    processor = RuleBoxF1Processor(connect=False)
+    corpus = []
+    for pdf_file in sorted(os.listdir(RAW_DATA_FOLDER)):
+        if pdf_file.endswith('.pdf'):
+            text_pages = processor.extract_text_from_pdf(os.path.join(RAW_DATA_FOLDER, pdf_file))
+            if text_pages:
+                corpus.append((pdf_file, text_pages))
+    return corpus
+
+
+def time_variant(corpus, header_fn, rule_fn, repeat):
+    best = None
+    rules = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rules = [rule for _, text_pages in corpus for rule in parse(text_pages, header_fn, rule_fn)]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return rules, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per variant; the best is reported')
+    parser.add_argument('--json', action='store_true', help='emit machine-readable JSON only')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    legacy_rules, legacy_seconds = time_variant(corpus, legacy_header, legacy_rule, args.repeat)
+    scanner_rules, scanner_seconds = time_variant(corpus, match_article_header, scanner_rule, args.repeat)
+    mismatches = sum(1 for old, new in zip(legacy_rules, scanner_rules) if old != new)
+    mismatches += abs(len(legacy_rules) - len(scanner_rules))
+
+    report = {
+        'files': [pdf_file for pdf_file, _ in corpus],
+        'pages': sum(len(text_pages) for _, text_pages in corpus),
+        'rules': len(scanner_rules),
+        'legacy': {'seconds': round(legacy_seconds, 4), 'rules_per_sec': round(len(legacy_rules) / legacy_seconds, 1)},
+        'scanner': {'seconds': round(scanner_seconds, 4), 'rules_per_sec': round(len(scanner_rules) / scanner_seconds, 1)},
+        'speedup': round(legacy_seconds / scanner_seconds, 2),
+        'mismatched_rules': mismatches
+    }
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"Corpus: {report['pages']} pages, {report['rules']} rules from {len(report['files'])} files")
+    print(f"Legacy:  {report['legacy']['rules_per_sec']:>10} rules/sec ({report['legacy']['seconds']}s)")
+    print(f"Scanner: {report['scanner']['rules_per_sec']:>10} rules/sec ({report['scanner']['seconds']}s)")
+    print(f"Speedup: {report['speedup']}x, mismatched rules: {report['mismatched_rules']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """Collapse case and whitespace so equivalent queries share a cache key"""
+    return ' '.join(str(query).lower().split())
+
+
+class QueryCache:
+    """Bounded LRU cache with TTL, a memory cap and generation-based invalidation.
+
+    Read `generation` before computing a result and pass it to put(): a result
+    computed while the cache was invalidated is then dropped instead of being
+    stored as fresh under the new generation.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def make_key(self, query, category_filter=None, limit=10):
+        return (normalize_query(query), (category_filter or '').lower(), limit)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, generation, value = entry
+            if generation != self.generation or expires_at < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return [dict(item) for item in value]
+
+    def put(self, key, value, generation=None):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is None:
+                generation = self.generation
+            elif generation != self.generation:
+                self.stale_puts += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, generation, [dict(item) for item in value])
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self):
+        """Start a new generation, dropping every cached result"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'generation': self.generation,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'stale_puts': self.stale_puts
+            }
@@ -0,0 +1,82 @@
+import asyncio
+
+# The rules summary lives in the `summary` collection. Its counts are kept
+# current at write time with $inc, so readers never scan the rules collection.
+SUMMARY_FILTER = {'type': 'rules_summary'}
+# Summaries written before write-time counting lack this and are recounted once
+STATS_VERSION = 2
+EXCLUDED_COLLECTIONS = ['system.indexes']
+
+
+def _field(name):
+    """Category names as usable document keys"""
+    return str(name or 'unknown').replace('.', '_').lstrip('$')
+
+
+def rule_increments(added=(), removed=()):
+    """$inc paths that add and remove rules from the summary counts"""
+    increments = {}
+    for rules, sign in ((added, 1), (removed, -1)):
+        for rule in rules:
+            category = _field(rule.get('category'))
+            subcategory = _field(rule.get('subcategory'))
+            for path in ('total_rules', f'categories.{category}', f'subcategories.{subcategory}',
+                         f'breakdown.{category}.{subcategory}'):
+                increments[path] = increments.get(path, 0) + sign
+    return {path: delta for path, delta in increments.items() if delta}
+
+
+def summary_from_groups(groups):
+    """Summary counts from a $group by category and subcategory"""
+    stats = {'total_rules': 0, 'categories': {}, 'subcategories': {}, 'breakdown': {}}
+    for group in groups:
+        category = _field(group['_id'].get('category'))
+        subcategory = _field(group['_id'].get('subcategory'))
+        count = group['count']
+        stats['total_rules'] += count
+        stats['categories'][category] = stats['categories'].get(category, 0) + count
+        stats['subcategories'][subcategory] = stats['subcategories'].get(subcategory, 0) + count
+        breakdown = stats['breakdown'].setdefault(category, {})
+        breakdown[subcategory] = breakdown.get(subcategory, 0) + count
+    return stats
+
+
+def _nonzero(counts):
+    """Drop keys whose count has been decremented back to zero"""
+    cleaned = {}
+    for key, value in (counts or {}).items():
+        if isinstance(value, dict):
+            value = _nonzero(value)
+        if value:
+            cleaned[key] = value
+    return cleaned
+
+
+async def read_collection_stats(db):
+    """Per-collection counts and the rules breakdown without scanning any collection.
+
+    Rules come from the summary document when it is current; every other
+    collection, and rules before the first ingest, use estimated_document_count,
+    which reads collection metadata.
+    """
+    names = [name for name in await db.list_collection_names() if name not in EXCLUDED_COLLECTIONS]
+    summary, *estimates = await asyncio.gather(
+        db.summary.find_one(SUMMARY_FILTER, {'_id': 0}),
+        *(db[name].estimated_document_count() for name in names)
+    )
+    collections = dict(zip(names, estimates))
+    current = summary is not None and summary.get('stats_version') == STATS_VERSION
+    if current:
+        collections['rules'] = summary.get('total_rules', 0)
+    return {
+        'collections': collections,
+        'total_documents': sum(collections.values()),
+        'rules': {
+            'total': collections.get('rules', 0),
+            'categories': _nonzero(summary.get('categories')) if current else {},
+            'subcategories': _nonzero(summary.get('subcategories')) if current else {},
+            'breakdown': _nonzero(summary.get('breakdown')) if current else {},
+            'last_updated': summary.get('last_updated') if current else None,
+            'source': 'summary' if current else 'estimated'
+        }
+    }
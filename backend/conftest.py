@@ -0,0 +1,128 @@
+import copy
+
+import pytest
+
+from datacollect import RuleBoxF1Processor
+
+TOPICS = [
+    ('Sporting', 'safety car', 'The safety car may be deployed when competitors are in immediate danger.'),
+    ('Sporting', 'black flag', 'A black flag means the driver is disqualified and must return to the pits.'),
+    ('Sporting', 'pit lane speed', 'The pit lane speed limit is 80 km/h during the race.'),
+    ('Technical', 'power unit', 'Each driver may use no more than four power unit elements per season.'),
+    ('Technical', 'rear wing', 'The rear wing must fit within the reference volume.'),
+    ('Financial', 'cost cap', 'Marketing costs are excluded from the cost cap.'),
+]
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        method = getattr(self._cursor, name)
+
+        def chain(*args, **kwargs):
+            method(*args, **kwargs)
+            return self
+        return chain
+
+    async def to_list(self, length=None):
+        return list(self._cursor)[:length]
+
+
+class AsyncCollection:
+    """Just enough of a Motor collection over a mongomock one"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self._collection.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncDatabase:
+    def __init__(self, db):
+        self._db = db
+
+    def __getitem__(self, name):
+        return AsyncCollection(self._db[name])
+
+    async def list_collection_names(self):
+        return self._db.list_collection_names()
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+@pytest.fixture
+def make_rules():
+    """Factory for rules covering every TOPICS entry `copies` times"""
+    def make(copies=8):
+        rules = []
+        for number in range(copies):
+            for category, title, content in TOPICS:
+                rules.append({
+                    'rule_id': f'{title}-{number}',
+                    'title': f'{title.title()} {number}',
+                    'content': f'{content} Article {number}.',
+                    'category': category,
+                    'subcategory': 'general',
+                    'metadata': {'keywords': title.split()}
+                })
+        return rules
+    return make
+
+
+@pytest.fixture
+def make_db():
+    """Factory for a fresh mongomock database holding `count` rules"""
+    mongomock = pytest.importorskip('mongomock')
+
+    def make(count=0):
+        db = mongomock.MongoClient()['rulebox_test']
+        if count:
+            db.rules.insert_many([
+                {'rule_id': f'rule-{n}', 'title': f'Rule {n}', 'content': f'Content {n}',
+                 'metadata': {'content_hash': f'h{n}'}}
+                for n in range(count)
+            ])
+        return db
+    return make
+
+
+@pytest.fixture
+def mongo_db(make_db):
+    return make_db()
+
+
+@pytest.fixture
+def async_db(mongo_db):
+    """Motor-style view of mongo_db"""
+    return AsyncDatabase(mongo_db)
+
+
+@pytest.fixture
+def make_processor():
+    """Factory for an unconnected processor over `db` (sync and async), with search indexes over `rules`"""
+    def make(db=None, rules=None, ai_client=None):
+        processor = RuleBoxF1Processor(connect=False)
+        if db is not None:
+            processor.db = db
+            processor.async_db = AsyncDatabase(db)
+        if rules is not None:
+            processor._build_indexes(copy.deepcopy(rules))
+        if ai_client is not None:
+            processor.ai_client = ai_client
+
+            async def rebuild():
+                pass
+            processor.async_build_search_index = rebuild
+        return processor
+    return make
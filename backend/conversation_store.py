@@ -0,0 +1,156 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+# Client-chosen ids (e.g. UUIDs); anything else is rejected before it reaches a query
+CONVERSATION_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+
+def valid_conversation_id(conversation_id):
+    return isinstance(conversation_id, str) and CONVERSATION_ID_PATTERN.fullmatch(conversation_id) is not None
+
+
+def estimate_text_tokens(text):
+    """Rough token count: ~4 characters per token"""
+    return len(text or '') // 4
+
+
+def estimate_tokens(message):
+    """Rough message token count, including per-message overhead"""
+    return estimate_text_tokens(message.get('content')) + 4
+
+
+def truncate_to_budget(messages, token_budget):
+    """Keep a leading system message and the newest messages that fit within the token budget"""
+    system = messages[:1] if messages and messages[0].get('role') == 'system' else []
+    budget = token_budget - sum(estimate_tokens(message) for message in system)
+    kept = []
+    for message in reversed(messages[len(system):]):
+        budget -= estimate_tokens(message)
+        if budget < 0:
+            break
+        kept.append(message)
+    return system + kept[::-1]
+
+
+class ConversationStore:
+    """Conversation histories bounded by count, memory and idle time, each trimmed to a token budget.
+
+    With a Motor collection, Mongo is the source of truth so history survives
+    restarts and is shared across workers; idle conversations then expire
+    through a TTL index instead of the in-memory LRU.
+
+    Conversations are keyed by (user, conversation_id), so one user can never
+    read or extend another's history; anonymous requests share user None.
+    """
+
+    def __init__(self, max_conversations=1000, max_bytes=16 * 1024 * 1024, idle_ttl=3600,
+                 token_budget=3000, collection=None):
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.token_budget = token_budget
+        self.collection = collection
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._indexes_ready = False
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _size(messages):
+        return sum(len(message.get('content') or '') for message in messages)
+
+    @staticmethod
+    def _key(conversation_id, user):
+        if not valid_conversation_id(conversation_id):
+            raise ValueError('Invalid conversation_id')
+        return (str(user) if user else '', conversation_id)
+
+    @staticmethod
+    def _document_id(key):
+        # Both values are plain strings, so the filter is an exact match on the pair
+        return {'user': key[0], 'conversation': key[1]}
+
+    async def get(self, conversation_id, user=None):
+        """Return a copy of the user's conversation messages, or an empty list"""
+        if not conversation_id:
+            return []
+        key = self._key(conversation_id, user)
+        if self.collection is not None:
+            doc = await self.collection.find_one({'_id': self._document_id(key)}, {'messages': 1})
+            return list(doc['messages']) if doc else []
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                return []
+            self._entries.move_to_end(key)
+            self._entries[key] = (time.monotonic(), entry[1], entry[2])
+            return list(entry[1])
+
+    async def save(self, conversation_id, messages, user=None):
+        if not conversation_id:
+            return
+        key = self._key(conversation_id, user)
+        messages = truncate_to_budget(messages, self.token_budget)
+        if self.collection is not None:
+            await self._ensure_indexes()
+            await self.collection.replace_one(
+                {'_id': self._document_id(key)},
+                {'messages': messages, 'updated_at': datetime.utcnow()},
+                upsert=True
+            )
+            return
+        size = self._size(messages)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (time.monotonic(), messages, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_conversations or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def _expire(self):
+        # Entries are in last-used order, so expired ones are at the front
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._entries:
+            key, (last_used, _, size) = next(iter(self._entries.items()))
+            if last_used >= cutoff:
+                break
+            del self._entries[key]
+            self._bytes -= size
+            self.expirations += 1
+
+    async def _ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        try:
+            await self.collection.create_index('updated_at', expireAfterSeconds=self.idle_ttl)
+        except Exception as e:
+            print(f"Conversation index warning: {e}")
+        self._indexes_ready = True
+
+    def stats(self):
+        if self.collection is not None:
+            return {'backend': 'mongodb', 'idle_ttl_seconds': self.idle_ttl, 'token_budget': self.token_budget}
+        with self._lock:
+            self._expire()
+            return {
+                'backend': 'memory',
+                'conversations': len(self._entries),
+                'max_conversations': self.max_conversations,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'idle_ttl_seconds': self.idle_ttl,
+                'token_budget': self.token_budget,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+
+load_dotenv()
+
+MONGODB_URL = os.getenv('MONGODB_URL', 'mongodb://localhost:27017/')
+DATABASE_NAME = 'rulebox_f1_database'
+
+TEXT_INDEX_NAME = 'rules_text_index'
+TEXT_INDEX_FIELDS = ('title', 'content', 'metadata.keywords')
+
+# Every index the app relies on, as (collection, keys, options). create_index is
+# idempotent, so these are safe to apply on every start.
+INDEX_SPECS = [
+    ('rules', [(field, 'text') for field in TEXT_INDEX_FIELDS], {'name': TEXT_INDEX_NAME}),
+    ('rules', 'category', {}),
+    ('rules', 'rule_id', {}),
+    ('rules', 'metadata.effective_date', {}),
+    ('rules', 'source_file', {}),
+    ('ingest_manifest', 'file', {'unique': True}),
+]
+
+# One connection pool per driver for the whole process; neither constructor does I/O
+_lock = threading.Lock()
+_sync_client = None
+_async_client = None
+_indexes_ready = False
+
+
+def get_sync_client():
+    global _sync_client
+    with _lock:
+        if _sync_client is None:
+            _sync_client = MongoClient(MONGODB_URL)
+        return _sync_client
+
+
+def get_async_client():
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            _async_client = AsyncIOMotorClient(MONGODB_URL)
+        return _async_client
+
+
+def get_database():
+    return get_sync_client()[DATABASE_NAME]
+
+
+def get_async_database():
+    return get_async_client()[DATABASE_NAME]
+
+
+def stale_text_indexes(index_info):
+    """Names of text indexes on rules that differ from TEXT_INDEX_NAME over TEXT_INDEX_FIELDS.
+
+    Older versions created rules_text_index over title and content only, or an
+    auto-named index over all three fields. A collection can hold one text
+    index, so either one makes creating the current spec fail until dropped.
+    """
+    stale = []
+    for name, info in index_info.items():
+        text_keys = {field for field, kind in info.get('key', []) if kind == 'text'}
+        if not text_keys:
+            continue
+        # MongoDB reports text indexes as _fts keys with the indexed fields in weights
+        fields = set(info['weights']) if 'weights' in info else text_keys
+        if name != TEXT_INDEX_NAME or fields != set(TEXT_INDEX_FIELDS):
+            stale.append(name)
+    return stale
+
+
+async def ensure_indexes():
+    """Create all indexes concurrently, once per process; returns seconds spent, or None if already done"""
+    global _indexes_ready
+    if _indexes_ready:
+        return None
+    started = time.perf_counter()
+    db = get_async_database()
+    try:
+        for name in stale_text_indexes(await db.rules.index_information()):
+            print(f"Replacing outdated text index {name}")
+            await db.rules.drop_index(name)
+    except Exception as e:
+        print(f"Text index migration warning: {e}")
+    results = await asyncio.gather(
+        *(db[collection].create_index(keys, **options) for collection, keys, options in INDEX_SPECS),
+        return_exceptions=True
+    )
+    failed = False
+    for (collection, keys, _), result in zip(INDEX_SPECS, results):
+        if isinstance(result, Exception):
+            failed = True
+            print(f"Index creation warning for {collection} {keys}: {result}")
+    # Retried on the next call if anything failed, e.g. Mongo was still starting
+    _indexes_ready = not failed
+    return time.perf_counter() - started
+
+
+def ensure_indexes_sync(db):
+    """Blocking variant of ensure_indexes for a given database; returns True if every index exists"""
+    ok = True
+    try:
+        for name in stale_text_indexes(db.rules.index_information()):
+            print(f"Replacing outdated text index {name}")
+            db.rules.drop_index(name)
+    except Exception as e:
+        print(f"Text index migration warning: {e}")
+    for collection, keys, options in INDEX_SPECS:
+        try:
+            db[collection].create_index(keys, **options)
+        except Exception as e:
+            ok = False
+            print(f"Index creation warning for {collection} {keys}: {e}")
+    return ok
+
+
+def close_clients():
+    global _sync_client, _async_client
+    with _lock:
+        if _sync_client is not None:
+            _sync_client.close()
+        if _async_client is not None:
+            _async_client.close()
+        _sync_client = _async_client = None
@@ -1,16 +1,35 @@
 import PyPDF2
-import re
+import json
+import hashlib
 import requests
 import os
 from datetime import datetime
-from pymongo import MongoClient
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+import asyncio
+import time
+import queue
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 # from openai import OpenAI
 # from sentence_transformers import SentenceTransformer
 import numpy as np
 # from sklearn.metrics.pairwise import cosine_similarity
 # import torch
-import httpx
 from dotenv import load_dotenv
+from fastapi import HTTPException
+from http_client import OPENROUTER_BASE_URL, create_http_client
+from search_index import BM25Index
+from vector_index import HashingEmbedder, VectorIndex
+from cache import QueryCache
+from singleflight import SingleFlight
+from admission import RateLimiter
+from database import DATABASE_NAME, ensure_indexes_sync, get_async_client, get_sync_client
+import metrics
+from collection_stats import STATS_VERSION, SUMMARY_FILTER, rule_increments, summary_from_groups
+from rule_scanner import clean_text, extract_keywords, match_article_header, scan_features, scan_rule
 
 # if not torch.cuda.is_available():
 #     print("Warning: CUDA is not available. PyTorch will use the CPU backend.")
@@ -18,14 +37,65 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '256'))
+RRF_K = 60
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '1024'))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv('SEARCH_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '300'))
+
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '1'))
+# A pool starts every worker up front, so never more than there are CPUs
+MAX_INGEST_WORKERS = os.cpu_count() or 1
+INGEST_PAGE_CHUNK = int(os.getenv('INGEST_PAGE_CHUNK', '40'))
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '64'))
+# Failures that may not recur (I/O errors, a crashed worker): the file is retried on the next run
+TRANSIENT_INGEST_ERRORS = (OSError, BrokenProcessPool)
+
+STORE_BATCH_SIZE = int(os.getenv('STORE_BATCH_SIZE', '500'))
+
+# Optional ingest stage that stores a plain-language AI summary on each rule
+AI_SUMMARY_MODEL = os.getenv('AI_SUMMARY_MODEL', 'deepseek/deepseek-r1')
+AI_SUMMARY_CONCURRENCY = int(os.getenv('AI_SUMMARY_CONCURRENCY', '4'))
+AI_SUMMARY_RATE_PER_MINUTE = float(os.getenv('AI_SUMMARY_RATE_PER_MINUTE', '60'))
+AI_SUMMARY_MAX_TOKENS = int(os.getenv('AI_SUMMARY_MAX_TOKENS', '150'))
+AI_SUMMARY_INPUT_CHARS = 4000
+
+# Metadata that changes on every ingest without the rule itself changing
+HASH_EXCLUDED_METADATA = {'last_modified', 'content_hash', 'embedding', 'ai_summary_hash'}
+
+# Fields that are never needed by API responses
+RULE_PROJECTION = {'metadata.embedding': 0, 'metadata.last_modified': 0}
+
+# Per-file ingest timings and the stage names they are exported under on /metrics
+INGEST_STAGE_NAMES = {
+    'extract_seconds': 'pdf_extract',
+    'parse_seconds': 'parse',
+    'embed_seconds': 'embed',
+    'total_seconds': 'ingest_file'
+}
+
 class OpenRouterClient:
-    def __init__(self, api_key, base_url="https://openrouter.ai/api/v1"):
+    def __init__(self, api_key, base_url=OPENROUTER_BASE_URL, http_client=None):
         self.api_key = api_key
         self.base_url = base_url
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        # One pooled client for the lifetime of this object, so calls reuse warm connections
+        self._http_client = http_client
+        self._owns_http_client = http_client is None
+
+    @property
+    def http_client(self):
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = create_http_client()
+            self._owns_http_client = True
+        return self._http_client
+
+    async def aclose(self):
+        if self._owns_http_client and self._http_client is not None:
+            await self._http_client.aclose()
 
     async def chat(self, model, messages, max_tokens=1000, temperature=0.3):
         payload = {
@@ -35,14 +105,13 @@ class OpenRouterClient:
             "temperature": temperature
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json=payload
-            )
-            response.raise_for_status()
-            return response.json()
+        response = await self.http_client.post(
+            f"{self.base_url}/chat/completions",
+            headers=self.headers,
+            json=payload
+        )
+        response.raise_for_status()
+        return response.json()
 
     def embeddings_create(self, **kwargs):
         # Simplified embeddings - you can implement this if needed
@@ -50,13 +119,34 @@ class OpenRouterClient:
         return None
 
 class RuleBoxF1Processor:
-    def __init__(self):
+    def __init__(self, async_client=None, connect=True):
+        self.embedding_model = HashingEmbedder()
+        # (BM25Index, VectorIndex) over the same rule list, replaced as one tuple so a
+        # search never pairs the dense matrix of one build with the documents of another
+        self._indexes = None
+        self.search_cache = QueryCache(
+            max_entries=SEARCH_CACHE_SIZE,
+            max_bytes=SEARCH_CACHE_MAX_BYTES,
+            ttl=SEARCH_CACHE_TTL
+        )
+        self.search_flight = SingleFlight()
+        # Shared by every summary run, so overlapping runs still respect the upstream rate
+        self.summary_rate = RateLimiter(AI_SUMMARY_RATE_PER_MINUTE)
+        if not connect:
+            # Parse-only instance (e.g. ingest worker processes): no database or AI clients
+            self.client = self.db = self.async_client = self.async_db = self.ai_client = None
+            self._indexes_ready = self._summary_ready = False
+            return
+
         # Use environment variables instead of hardcoded values
-        MONGODB_URL = os.getenv('MONGODB_URL')  # Keep as MONGODB_URL
         openrouter_api_key = os.getenv('OPENROUTER_API_KEY', '')
         
-        self.client = MongoClient(MONGODB_URL)  # Keep as MONGODB_URL
-        self.db = self.client['rulebox_f1_database']
+        # Shared per-process connection pools; creating them does no I/O
+        self.client = get_sync_client()
+        self.db = self.client[DATABASE_NAME]
+        # Async reads go through Motor so they never block the event loop
+        self.async_client = async_client or get_async_client()
+        self.async_db = self.async_client[DATABASE_NAME]
         if openrouter_api_key:
             try:
                 self.ai_client = OpenRouterClient(api_key=openrouter_api_key)
@@ -67,23 +157,25 @@ class RuleBoxF1Processor:
         else:
             self.ai_client = None
             print("Warning: No OpenRouter API key provided. AI features will be disabled.")
-        # self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2', device='cuda' if torch.cuda.is_available() else 'cpu')
-        self.embedding_model = None  # Temporarily disabled
-        self._create_indexes()
+        self._indexes_ready = False
+        self._summary_ready = False
+
+    @property
+    def search_index(self):
+        indexes = self._indexes
+        return indexes[0] if indexes else None
+
+    @property
+    def vector_index(self):
+        indexes = self._indexes
+        return indexes[1] if indexes else None
 
     def _create_indexes(self):
-        try:
-            self.db.rules.create_index([
-                ("title", "text"),
-                ("content", "text"),
-                ("metadata.keywords", "text")
-            ])
-            self.db.rules.create_index("category")
-            self.db.rules.create_index("rule_id")
-            self.db.rules.create_index("metadata.effective_date")
-            print("Database indexes created successfully")
-        except Exception as e:
-            print(f"Index creation warning: {e}")
+        """Ensure indexes before the first write; the API also does this at startup, off the request path"""
+        if not self._indexes_ready:
+            self._indexes_ready = ensure_indexes_sync(self.db)
+            if self._indexes_ready:
+                print("Database indexes created successfully")
 
     def download_regulations(self):
         urls = {
@@ -109,77 +201,123 @@ class RuleBoxF1Processor:
                 print(f"✗ Error downloading {reg_type} regulations: {e}")
         return downloaded_files
 
-    def extract_text_from_pdf(self, pdf_path):
+    def count_pdf_pages(self, pdf_path):
         try:
             with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text_pages = []
-                for page_num, page in enumerate(pdf_reader.pages):
-                    try:
-                        text = page.extract_text()
-                        if text.strip():
-                            text_pages.append({
-                                'page_number': page_num + 1,
-                                'text': text
-                            })
-                    except Exception as e:
-                        print(f"Warning: Could not extract text from page {page_num + 1}: {e}")
-                return text_pages
+                return len(PyPDF2.PdfReader(file).pages)
+        except Exception as e:
+            print(f"Error reading {pdf_path}: {e}")
+            return 0
+
+    def iter_pdf_pages(self, pdf_path, first_page=0, last_page=None, timings=None):
+        """Yield extracted pages one at a time instead of holding the whole document"""
+        with open(pdf_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            last_page = len(pdf_reader.pages) if last_page is None else min(last_page, len(pdf_reader.pages))
+            for page_num in range(first_page, last_page):
+                started = time.perf_counter()
+                try:
+                    text = pdf_reader.pages[page_num].extract_text()
+                except Exception as e:
+                    print(f"Warning: Could not extract text from page {page_num + 1}: {e}")
+                    continue
+                finally:
+                    if timings is not None:
+                        timings['extract_seconds'] = timings.get('extract_seconds', 0.0) + time.perf_counter() - started
+                if text.strip():
+                    yield {
+                        'page_number': page_num + 1,
+                        'text': text
+                    }
+
+    def extract_text_from_pdf(self, pdf_path, first_page=0, last_page=None):
+        try:
+            return list(self.iter_pdf_pages(pdf_path, first_page, last_page))
         except Exception as e:
             print(f"Error extracting text from {pdf_path}: {e}")
             return []
 
     def clean_and_structure_text(self, text):
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r'[^\w\s.,():\-–—/\[\]{}"]', '', text)
-        text = text.replace('fi', 'fi').replace('fl', 'fl')
-        return text.strip()
+        return clean_text(text)
 
-    def parse_regulations_structure(self, text_pages, regulation_type):
-        rules_data = []
+    def iter_rules(self, text_pages, regulation_type, timings=None):
+        """Yield rule objects (without embeddings) as each article is completed"""
         current_article = None
         current_content = []
-        article_patterns = [
-            r'\bARTICLE\s+(\d+(?:\.\d+)?)\s*[:\-–—]?\s*(.+?)(?=\n|\r|$)',
-            r'^(\d+(?:\.\d+)?)\s+(.+?)(?=\n|\r|$)',
-            r'\b(\d+(?:\.\d+)?)\s*\.\s*(.+?)(?=\n|\r|$)'
-        ]
+        last_page_number = 1
         for page_info in text_pages:
+            started = time.perf_counter()
+            page_rules = []
+            last_page_number = page_info['page_number']
             lines = page_info['text'].split('\n')
             for line in lines:
                 line = line.strip()
                 if not line:
                     continue
-                article_match = None
-                for pattern in article_patterns:
-                    article_match = re.match(pattern, line, re.IGNORECASE)
-                    if article_match:
-                        break
+                article_match = match_article_header(line)
                 if article_match:
                     if current_article:
-                        rules_data.append(self._create_rule_object(
+                        page_rules.append(self._create_rule_object(
                             current_article,
                             '\n'.join(current_content),
                             regulation_type,
                             page_info['page_number']
                         ))
                     current_article = {
-                        'number': article_match.group(1),
-                        'title': article_match.group(2).strip()
+                        'number': article_match[0],
+                        'title': article_match[1].strip()
                     }
                     current_content = []
                 else:
                     if current_article:
                         current_content.append(line)
+            if timings is not None:
+                timings['parse_seconds'] = timings.get('parse_seconds', 0.0) + time.perf_counter() - started
+            yield from page_rules
         if current_article:
-            rules_data.append(self._create_rule_object(
+            yield self._create_rule_object(
                 current_article,
                 '\n'.join(current_content),
                 regulation_type,
-                text_pages[-1]['page_number'] if text_pages else 1
-            ))
+                last_page_number
+            )
+
+    def parse_regulations_structure(self, text_pages, regulation_type):
+        rules_data = list(self.iter_rules(text_pages, regulation_type))
+        self._embed_rules(rules_data)
         return rules_data
 
+    def iter_embedded_rules(self, rules, timings=None):
+        """Embed a stream of rules in EMBEDDING_BATCH_SIZE batches, yielding them as each batch completes"""
+        batch = []
+        for rule in rules:
+            batch.append(rule)
+            if len(batch) >= EMBEDDING_BATCH_SIZE:
+                yield from self._embed_batch(batch, timings)
+                batch = []
+        if batch:
+            yield from self._embed_batch(batch, timings)
+
+    def _embed_batch(self, batch, timings):
+        started = time.perf_counter()
+        self._embed_rules(batch)
+        if timings is not None:
+            timings['embed_seconds'] = timings.get('embed_seconds', 0.0) + time.perf_counter() - started
+        return batch
+
+    def _embedding_text(self, rule):
+        return f"{rule.get('title', '')} {rule.get('content', '')}"
+
+    def _embed_rules(self, rules_data):
+        """Fill metadata.embedding for each rule, encoding in batches"""
+        if self.embedding_model is None:
+            return
+        for start in range(0, len(rules_data), EMBEDDING_BATCH_SIZE):
+            batch = rules_data[start:start + EMBEDDING_BATCH_SIZE]
+            vectors = self.embedding_model.encode_batch([self._embedding_text(rule) for rule in batch])
+            for rule, vector in zip(batch, vectors):
+                rule['metadata']['embedding'] = vector.tolist()
+
     def _create_rule_object(self, article_info, content, regulation_type, page_number):
         category_prefixes = {
             'technical': 'TR',
@@ -188,18 +326,17 @@ class RuleBoxF1Processor:
         }
         prefix = category_prefixes.get(regulation_type, 'GR')
         rule_id = f"{prefix}-2025-{article_info['number'].replace('.', '-')}"
-        clean_content = self.clean_and_structure_text(content)
-        embedding_text = f"{article_info['title']} {clean_content}"
-        # embedding = self.embedding_model.encode(embedding_text).tolist()
-        embedding = []  # Temporarily disabled embeddings
-        keywords = self._extract_keywords(embedding_text)
+        scanned = scan_rule(article_info['title'], content)
+        clean_content = scanned['content']
+        embedding = []  # Filled in batches by _embed_rules
+        keywords = scanned['keywords']
         rule = {
             'rule_id': rule_id,
             'article_number': article_info['number'],
-            'title': self.clean_and_structure_text(article_info['title']),
+            'title': scanned['title'],
             'content': clean_content,
             'category': regulation_type.title(),
-            'subcategory': self._determine_subcategory(article_info['title'], clean_content, regulation_type),
+            'subcategory': self._subcategory_from_text(scanned['lowered'], regulation_type),
             'page_number': page_number,
             'metadata': {
                 'effective_date': '2025-01-01',
@@ -210,29 +347,19 @@ class RuleBoxF1Processor:
                 'embedding': embedding
             },
             'related_articles': [],
-            'penalties': self._extract_penalties(clean_content),
+            'penalties': scanned['penalties'],
             'diagrams': [],
-            'examples': self._extract_examples(clean_content)
+            'examples': scanned['examples']
         }
         return rule
 
     def _extract_keywords(self, text):
-        f1_terms = {
-            'aerodynamic', 'downforce', 'drs', 'power unit', 'ers', 'kers',
-            'qualifying', 'grid', 'safety car', 'pit stop', 'penalty',
-            'championship', 'points', 'constructor', 'driver', 'team',
-            'engine', 'gearbox', 'suspension', 'brake', 'tire', 'tyre',
-            'fuel', 'weight', 'ballast', 'scrutineering', 'parc ferme'
-        }
-        words = re.findall(r'\b[a-zA-Z]{3,}\b', text.lower())
-        word_freq = {}
-        for word in words:
-            if word in f1_terms or len(word) > 4:
-                word_freq[word] = word_freq.get(word, 0) + 1
-        sorted_keywords = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-        return [word for word, freq in sorted_keywords[:10]]
+        return extract_keywords(text.lower())
 
     def _determine_subcategory(self, title, content, regulation_type):
+        return self._subcategory_from_text(f"{title} {content}".lower(), regulation_type)
+
+    def _subcategory_from_text(self, text_combined, regulation_type):
         subcategories = {
             'technical': {
                 'power_unit': ['power unit', 'engine', 'ers', 'fuel'],
@@ -257,7 +384,6 @@ class RuleBoxF1Processor:
                 'excluded_costs': ['excluded', 'exemption']
             }
         }
-        text_combined = f"{title} {content}".lower()
         if regulation_type in subcategories:
             for subcat, keywords in subcategories[regulation_type].items():
                 if any(keyword in text_combined for keyword in keywords):
@@ -265,213 +391,710 @@ class RuleBoxF1Processor:
         return 'general'
 
     def _extract_penalties(self, content):
-        penalties = []
-        penalty_patterns = [
-            r'(\d+)\s*second[s]?\s*time\s*penalty',
-            r'(\d+)\s*place[s]?\s*grid\s*penalty',
-            r'drive.through\s*penalty',
-            r'stop.and.go\s*penalty',
-            r'disqualification',
-            r'reprimand'
-        ]
-        for pattern in penalty_patterns:
-            matches = re.finditer(pattern, content, re.IGNORECASE)
-            for match in matches:
-                penalties.append(match.group(0))
-        return penalties
+        return scan_features(content)[0]
 
     def _extract_examples(self, content):
-        examples = []
-        example_patterns = [
-            r'for example[,:]?\s*([^.]+\.)',
-            r'such as[,:]?\s*([^.]+\.)',
-            r'including[,:]?\s*([^.]+\.)'
+        return scan_features(content)[1]
+
+    def _content_hash(self, rule):
+        """Stable hash of a rule's stored content, ignoring volatile and derived fields"""
+        hashed = {key: value for key, value in rule.items() if key not in ('_id', 'metadata', 'ai_summary')}
+        hashed['metadata'] = {
+            key: value for key, value in rule.get('metadata', {}).items()
+            if key not in HASH_EXCLUDED_METADATA
+        }
+        return hashlib.sha1(json.dumps(hashed, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def _store_batch(self, batch, counts):
+        for rule in batch:
+            rule['metadata']['content_hash'] = self._content_hash(rule)
+        existing = {
+            doc['rule_id']: doc
+            for doc in self.db.rules.find(
+                {'rule_id': {'$in': [rule['rule_id'] for rule in batch]}},
+                {'rule_id': 1, 'metadata.content_hash': 1, 'category': 1, 'subcategory': 1}
+            )
+        }
+        # Unchanged rules are skipped entirely; everything else is upserted in one round trip
+        changed = [
+            rule for rule in batch
+            if existing.get(rule['rule_id'], {}).get('metadata', {}).get('content_hash') != rule['metadata']['content_hash']
         ]
-        for pattern in example_patterns:
-            matches = re.finditer(pattern, content, re.IGNORECASE)
-            for match in matches:
-                examples.append(match.group(1).strip())
-        return examples[:3]
+        counts['unchanged'] += len(batch) - len(changed)
+        if not changed:
+            return
+        operations = [ReplaceOne({'rule_id': rule['rule_id']}, rule, upsert=True) for rule in changed]
+        try:
+            result = self.db.rules.bulk_write(operations, ordered=False)
+            counts['inserted'] += result.upserted_count
+            counts['updated'] += result.modified_count
+            upserted = set(result.upserted_ids)
+            failed = set()
+        except BulkWriteError as e:
+            details = e.details
+            counts['inserted'] += details.get('nUpserted', 0)
+            counts['updated'] += details.get('nModified', 0)
+            counts['errors'] += len(details.get('writeErrors', []))
+            print(f"Error storing {len(details.get('writeErrors', []))} rules: {details.get('writeErrors', [])[:1]}")
+            upserted = {entry['index'] for entry in details.get('upserted', [])}
+            failed = {error['index'] for error in details.get('writeErrors', [])}
 
-    def store_in_database(self, rules_data):
+        # Keep the summary counts current: new rules add one, and updates that moved a rule
+        # to another category or subcategory shift it
+        added, removed = [], []
+        for index, rule in enumerate(changed):
+            if index in failed:
+                continue
+            previous = existing.get(rule['rule_id'])
+            if index in upserted:
+                added.append(rule)
+            elif previous and (previous.get('category'), previous.get('subcategory')) != (rule.get('category'), rule.get('subcategory')):
+                added.append(rule)
+                removed.append(previous)
+        self._update_summary_stats(rule_increments(added, removed))
+
+    def store_in_database(self, rules_data, batch_size=None):
+        """Write rules with batched unordered bulk upserts, skipping rules whose content hash is unchanged"""
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+        batch_size = batch_size or STORE_BATCH_SIZE
         try:
             # Don't clear all rules, just update/insert new ones
             if rules_data:
-                # Insert rules one by one to handle duplicates
-                inserted_count = 0
-                for rule in rules_data:
-                    try:
-                        # Update if exists, insert if not
-                        result = self.db.rules.replace_one(
-                            {'rule_id': rule['rule_id']},
-                            rule,
-                            upsert=True
-                        )
-                        inserted_count += 1
-                    except Exception as e:
-                        print(f"Error inserting rule {rule.get('rule_id', 'unknown')}: {e}")
-                        continue
+                self._ensure_summary_stats()
+                # Later duplicates of a rule_id win, matching sequential upserts
+                unique_rules = list({rule['rule_id']: rule for rule in rules_data}.values())
+                for start in range(0, len(unique_rules), batch_size):
+                    with metrics.stage('store'):
+                        self._store_batch(unique_rules[start:start + batch_size], counts)
                 
-                print(f"✓ Stored {inserted_count} rules in database")
-                self._create_summary_stats(rules_data)
-                return inserted_count
+                print(f"✓ Stored rules in database: {counts}")
+                if counts['inserted'] or counts['updated']:
+                    self.search_cache.invalidate()
             else:
                 print("No rules to store")
-                return 0
         except Exception as e:
             print(f"Error storing rules in database: {e}")
-            return 0
+            counts['errors'] += 1
+        return counts
 
-    def _create_summary_stats(self, rules_data):
-        stats = {
-            'total_rules': len(rules_data),
-            'categories': {},
-            'subcategories': {},
-            'last_updated': datetime.now().isoformat(),
-            'regulation_year': 2025
-        }
-        for rule in rules_data:
-            category = rule['category']
-            stats['categories'][category] = stats['categories'].get(category, 0) + 1
-            subcategory = rule['subcategory']
-            stats['subcategories'][subcategory] = stats['subcategories'].get(subcategory, 0) + 1
-        self.db.summary.replace_one(
-            {'type': 'rules_summary'},
-            stats,
-            upsert=True
+    def _create_summary_stats(self):
+        """Recount the summary document from the whole collection; writes keep it current after that"""
+        grouped = self.db.rules.aggregate([
+            {'$group': {'_id': {'category': '$category', 'subcategory': '$subcategory'}, 'count': {'$sum': 1}}}
+        ])
+        stats = dict(
+            summary_from_groups(grouped),
+            type='rules_summary',
+            stats_version=STATS_VERSION,
+            last_updated=datetime.now().isoformat(),
+            regulation_year=2025
         )
+        self.db.summary.replace_one(SUMMARY_FILTER, stats, upsert=True)
+        self._summary_ready = True
+
+    def _ensure_summary_stats(self):
+        """Recount once if the summary predates write-time counting, so later $inc deltas start from the truth"""
+        if self._summary_ready:
+            return
+        summary = self.db.summary.find_one(SUMMARY_FILTER, {'stats_version': 1})
+        if summary and summary.get('stats_version') == STATS_VERSION:
+            self._summary_ready = True
+        else:
+            self._create_summary_stats()
+
+    def _update_summary_stats(self, increments):
+        """Apply write-time count deltas to the summary document, recounting if that fails"""
+        if not increments:
+            return
+        try:
+            self.db.summary.update_one(
+                SUMMARY_FILTER,
+                {'$inc': increments, '$set': {'last_updated': datetime.now().isoformat()}},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Summary stats update failed, recounting: {e}")
+            try:
+                self._create_summary_stats()
+            except Exception as e:
+                self._summary_ready = False
+                print(f"Summary stats recount failed: {e}")
+
+    def build_search_index(self):
+        """Load all rules and build the in-memory BM25 and vector indexes used by semantic_search"""
+        try:
+            rules = list(self.db.rules.find({}, {'metadata.last_modified': 0}))
+            self._build_indexes(rules)
+            print(f"✓ Search index built over {len(rules)} rules")
+            return len(rules)
+        except Exception as e:
+            print(f"Error building search index: {e}")
+            return 0
+
+    async def async_build_search_index(self):
+        """Async variant of build_search_index; index construction runs in a worker thread"""
+        try:
+            rules = await self.async_db.rules.find({}, {'metadata.last_modified': 0}).to_list(length=None)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._build_indexes, rules)
+            print(f"✓ Search index built over {len(rules)} rules")
+            return len(rules)
+        except Exception as e:
+            print(f"Error building search index: {e}")
+            return 0
+
+    def _build_indexes(self, rules):
+        dim = self.embedding_model.dim
+        matrix = np.zeros((len(rules), dim), dtype=np.float32)
+        missing = []
+        for row, rule in enumerate(rules):
+            embedding = rule.get('metadata', {}).pop('embedding', None)
+            if embedding and len(embedding) == dim:
+                matrix[row] = embedding
+            else:
+                missing.append(row)
+        # Rules stored before embeddings were enabled are encoded on the fly
+        for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+            rows = missing[start:start + EMBEDDING_BATCH_SIZE]
+            matrix[rows] = self.embedding_model.encode_batch([self._embedding_text(rules[row]) for row in rows])
+        vector_index = VectorIndex(matrix, [rule.get('category', '') for rule in rules])
+        search_index = BM25Index.from_rules(rules)
+        self._indexes = (search_index, vector_index)
+        self.search_cache.invalidate()
+
+    def vector_search(self, query, limit=10, category_filter=None):
+        indexes = self._indexes
+        if indexes is None:
+            return []
+        search_index, vector_index = indexes
+        query_vector = self.embedding_model.encode(query)
+        results = []
+        for doc_id, score in vector_index.top(query_vector, limit, category_filter):
+            rule = dict(search_index.documents[doc_id])
+            rule['score'] = round(score, 4)
+            results.append(rule)
+        return results
+
+    def _hybrid_search(self, query, limit, category_filter, indexes=None):
+        # Reciprocal rank fusion of the lexical (BM25) and vector rankings
+        search_index, vector_index = indexes or self._indexes
+        depth = limit * 3
+        fused = {}
+        lexical = search_index.top(query, depth, category_filter)
+        if not lexical:
+            # Hashed embeddings give almost any query a small positive cosine against many
+            # rules, so dense hits only re-rank and extend queries that match some term
+            return []
+        dense = vector_index.top(self.embedding_model.encode(query), depth, category_filter)
+        for ranking in (lexical, dense):
+            for rank, (doc_id, _) in enumerate(ranking):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        top = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:limit]
+        results = []
+        for doc_id, score in top:
+            rule = dict(search_index.documents[doc_id])
+            rule['score'] = round(score, 6)
+            results.append(rule)
+        return results
 
     def semantic_search(self, query, limit=10, category_filter=None):
+        cache_key = self.search_cache.make_key(query, category_filter, limit)
+        # Read before the index is snapshotted, so a rebuild meanwhile keeps the result out of the cache
+        generation = self.search_cache.generation
+        cached = self.search_cache.get(cache_key)
+        metrics.cache_result('search', cached is not None)
+        if cached is not None:
+            return cached
         try:
-            # Fallback to text-based search when embeddings are disabled
-            mongo_filter = {
-                "$or": [
-                    {"title": {"$regex": query, "$options": "i"}},
-                    {"content": {"$regex": query, "$options": "i"}},
-                    {"metadata.keywords": {"$regex": query, "$options": "i"}}
-                ]
-            }
-            if category_filter:
-                mongo_filter['category'] = category_filter
-            
-            rules = list(self.db.rules.find(mongo_filter).limit(limit))
-            if not rules:
-                print("Warning: No rules found matching the query.")
-                return []
-            
-            return rules
+            with metrics.stage('search'):
+                results = self._semantic_search(query, limit, category_filter)
         except Exception as e:
             print(f"Error in semantic search: {e}")
             return []
+        self.search_cache.put(cache_key, results, generation)
+        return results
+
+    def _semantic_search(self, query, limit=10, category_filter=None):
+        indexes = self._indexes
+        if indexes is not None and len(indexes[0]):
+            return self._hybrid_search(query, limit, category_filter, indexes)
+
+        # Fallback to regex scan until the search index has been built
+        rules = list(self.db.rules.find(self._regex_filter(query, category_filter), RULE_PROJECTION).limit(limit))
+        if not rules:
+            print("Warning: No rules found matching the query.")
+        return rules
+
+    def _regex_filter(self, query, category_filter=None):
+        mongo_filter = {
+            "$or": [
+                {"title": {"$regex": query, "$options": "i"}},
+                {"content": {"$regex": query, "$options": "i"}},
+                {"metadata.keywords": {"$regex": query, "$options": "i"}}
+            ]
+        }
+        if category_filter:
+            mongo_filter['category'] = category_filter
+        return mongo_filter
+
+    def _text_filter(self, query, category_filter=None):
+        mongo_filter = {'$text': {'$search': query}}
+        if category_filter:
+            mongo_filter['category'] = category_filter
+        return mongo_filter
 
     def text_search(self, query, category_filter=None):
         try:
-            mongo_filter = {'$text': {'$search': query}}
-            if category_filter:
-                mongo_filter['category'] = category_filter
+            projection = dict(RULE_PROJECTION, score={'$meta': 'textScore'})
             results = list(self.db.rules.find(
-                mongo_filter,
-                {'score': {'$meta': 'textScore'}}
+                self._text_filter(query, category_filter),
+                projection
             ).sort([('score', {'$meta': 'textScore'})]).limit(20))
             return results
         except Exception as e:
             print(f"Error in text search: {e}")
             return []
 
-    def process_documents(self):
-        """Process all PDF files from the raw_data folder"""
-        raw_data_folder = os.path.join(os.path.dirname(__file__), 'raw_data')
+    async def async_semantic_search(self, query, limit=10, category_filter=None):
+        """Async variant of semantic_search that never blocks the event loop on Mongo"""
+        cache_key = self.search_cache.make_key(query, category_filter, limit)
+        generation = self.search_cache.generation
+        cached = self.search_cache.get(cache_key)
+        metrics.cache_result('search', cached is not None)
+        if cached is not None:
+            return cached
+        indexes = self._indexes
+        if indexes is not None and len(indexes[0]):
+            # In-memory ranking is CPU-only and sub-millisecond, so it runs inline
+            try:
+                with metrics.stage('search'):
+                    results = self._hybrid_search(query, limit, category_filter, indexes)
+            except Exception as e:
+                print(f"Error in semantic search: {e}")
+                return []
+            self.search_cache.put(cache_key, results, generation)
+            return results
+        # Identical concurrent misses share one Mongo query
+        return await self.search_flight.do(
+            cache_key,
+            lambda: self._async_fallback_search(cache_key, generation, query, limit, category_filter)
+        )
+
+    async def _async_fallback_search(self, cache_key, generation, query, limit, category_filter):
+        try:
+            with metrics.stage('search_mongo_fallback'):
+                results = await self.async_db.rules.find(
+                    self._regex_filter(query, category_filter),
+                    RULE_PROJECTION
+                ).limit(limit).to_list(length=limit)
+        except Exception as e:
+            print(f"Error in semantic search: {e}")
+            return []
+        # Rules stored or an index built while the query was awaited make this result stale
+        self.search_cache.put(cache_key, results, generation)
+        return results
+
+    async def async_text_search(self, query, category_filter=None, limit=20):
+        try:
+            projection = dict(RULE_PROJECTION, score={'$meta': 'textScore'})
+            return await self.async_db.rules.find(
+                self._text_filter(query, category_filter),
+                projection
+            ).sort([('score', {'$meta': 'textScore'})]).limit(limit).to_list(length=limit)
+        except Exception as e:
+            print(f"Error in text search: {e}")
+            return []
+
+    async def async_get_rule(self, rule_id):
+        try:
+            return await self.async_db.rules.find_one({'rule_id': rule_id}, RULE_PROJECTION)
+        except Exception as e:
+            print(f"Error fetching rule {rule_id}: {e}")
+            return None
+
+    def _summary_messages(self, rule):
+        content = rule.get('content', '')[:AI_SUMMARY_INPUT_CHARS]
+        return [
+            {"role": "system", "content": "You summarise Formula 1 regulation articles for fans. "
+                                          "Reply with at most three short plain-language sentences "
+                                          "and do not add facts that are not in the article."},
+            {"role": "user", "content": f"Article {rule.get('article_number', '')} {rule.get('title', '')}\n\n{content}"}
+        ]
+
+    async def _request_summary(self, rule, admission):
+        """One summary completion, queued behind interactive queries when given their admission controller"""
+        async def request():
+            with metrics.stage('llm_summary'):
+                return await self.ai_client.chat(
+                    AI_SUMMARY_MODEL, self._summary_messages(rule),
+                    max_tokens=AI_SUMMARY_MAX_TOKENS, temperature=0.2
+                )
+
+        if admission is None:
+            return await request()
+        while True:
+            try:
+                return await admission.call(request)
+            except HTTPException as e:
+                # Queue full or no slot in time: background work waits rather than failing
+                if e.status_code not in (429, 503):
+                    raise
+                await asyncio.sleep(float((e.headers or {}).get('Retry-After', 1)))
+
+    async def generate_ai_summaries(self, concurrency=None, rate_per_minute=None, force=False, limit=None,
+                                    admission=None, progress=None):
+        """Store an AI summary on every rule whose content changed since it was last summarised.
+
+        Each summary is written as soon as it is generated together with the
+        content hash it was made from (metadata.ai_summary_hash), so an
+        interrupted run resumes where it stopped and unchanged rules are skipped.
+        Calls share admission (an AdmissionController) with interactive queries
+        when it is given; progress, if given, is a dict kept up to date with the counts.
+        """
+        if not self.ai_client:
+            return {'error': 'AI summaries need OPENROUTER_API_KEY'}
+        started = time.perf_counter()
+        query = {} if force else {
+            '$or': [
+                {'metadata.ai_summary_hash': {'$exists': False}},
+                {'$expr': {'$ne': ['$metadata.ai_summary_hash', '$metadata.content_hash']}}
+            ]
+        }
+        cursor = self.async_db.rules.find(
+            query,
+            {'rule_id': 1, 'article_number': 1, 'title': 1, 'content': 1, 'metadata.content_hash': 1}
+        )
+        if limit:
+            cursor = cursor.limit(limit)
+        pending = await cursor.to_list(length=None)
+        # Rules left alone because their summary is current; with a limit, others may still be outstanding
+        skipped = 0 if force else await self.async_db.rules.count_documents({
+            'metadata.ai_summary_hash': {'$exists': True},
+            '$expr': {'$eq': ['$metadata.ai_summary_hash', '$metadata.content_hash']}
+        })
+
+        limiter = asyncio.Semaphore(concurrency or AI_SUMMARY_CONCURRENCY)
+        rate = self.summary_rate if rate_per_minute is None else RateLimiter(rate_per_minute)
+        counts = progress if progress is not None else {}
+        counts.update(pending=len(pending), summarized=0, failed=0)
+
+        async def summarize(rule):
+            async with limiter:
+                await rate.wait()
+                try:
+                    response = await self._request_summary(rule, admission)
+                    summary = (response['choices'][0]['message']['content'] or '').strip()
+                    if not summary:
+                        raise ValueError('empty summary')
+                    # Only store it if the rule wasn't re-ingested with new content meanwhile
+                    await self.async_db.rules.update_one(
+                        {'_id': rule['_id'], 'metadata.content_hash': rule.get('metadata', {}).get('content_hash')},
+                        {'$set': {
+                            'ai_summary': summary,
+                            'metadata.ai_summary_hash': rule.get('metadata', {}).get('content_hash')
+                        }}
+                    )
+                    counts['summarized'] += 1
+                except Exception as e:
+                    counts['failed'] += 1
+                    print(f"Error summarising {rule.get('rule_id')}: {e}")
+
+        await asyncio.gather(*(summarize(rule) for rule in pending))
+        if counts['summarized']:
+            print(f"✓ Generated {counts['summarized']} AI summaries")
+            # Search results and AI context are served from the index, so pick the summaries up
+            await self.async_build_search_index()
+        return {
+            **counts,
+            'skipped': skipped,
+            'elapsed_seconds': round(time.perf_counter() - started, 3)
+        }
+
+    def _regulation_type(self, pdf_file):
+        # Determine regulation type from filename
+        if 'technical' in pdf_file.lower():
+            return 'technical'
+        elif 'sporting' in pdf_file.lower():
+            return 'sporting'
+        elif 'financial' in pdf_file.lower():
+            return 'financial'
+        return 'general'
+
+    def _stream_file(self, pdf_file, pdf_path, regulation_type, writer):
+        """Stream one PDF through pages -> articles -> embedded rules -> batched writer"""
+        outcome = {'file': pdf_file, 'regulation_type': regulation_type, 'pages': 0, 'rule_ids': [], 'timings': {}}
+        timings = {}
+        started = time.perf_counter()
+        errors_before = writer.counts['errors']
+
+        def counted_pages():
+            for page in self.iter_pdf_pages(pdf_path, timings=timings):
+                outcome['pages'] += 1
+                yield page
+
+        try:
+            pages = _bounded(counted_pages())
+            rules = _bounded(self.iter_embedded_rules(self.iter_rules(pages, regulation_type, timings), timings))
+            for rule in rules:
+                rule['source_file'] = pdf_file
+                outcome['rule_ids'].append(rule['rule_id'])
+                writer.add(rule)
+            writer.flush()
+            if not outcome['pages']:
+                outcome['error'] = 'No text extracted from PDF'
+        except Exception as e:
+            # Batches written before the failure stay in the database
+            writer.flush()
+            outcome['error'] = str(e)
+            outcome['transient'] = isinstance(e, TRANSIENT_INGEST_ERRORS)
+        if writer.counts['errors'] > errors_before:
+            outcome['store_error'] = True
+        timings['total_seconds'] = time.perf_counter() - started
+        outcome['timings'] = {name: round(seconds, 3) for name, seconds in timings.items()}
+        return outcome
+
+    def _process_files_parallel(self, jobs, workers):
+        """Fan page ranges and then whole-file parses out to a process pool, yielding outcomes in job order"""
+        # spawn, not fork: the API process runs uvicorn, Motor and pymongo threads that a fork
+        # would copy mid-flight; workers only need a RuleBoxF1Processor(connect=False)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            page_futures = []
+            for pdf_file, pdf_path, regulation_type in jobs:
+                page_count = self.count_pdf_pages(pdf_path)
+                page_futures.append([
+                    pool.submit(_extract_pages_job, pdf_path, start, min(start + INGEST_PAGE_CHUNK, page_count))
+                    for start in range(0, page_count, INGEST_PAGE_CHUNK)
+                ])
+
+            parse_futures = []
+            outcomes = []
+            for (pdf_file, pdf_path, regulation_type), futures in zip(jobs, page_futures):
+                outcome = {'file': pdf_file, 'regulation_type': regulation_type, 'pages': 0, 'rules': [], 'timings': {}}
+                outcomes.append(outcome)
+                try:
+                    # Page ranges are merged in submission order so page numbering stays sequential
+                    text_pages = []
+                    extract_seconds = 0.0
+                    for future in futures:
+                        pages, elapsed = future.result()
+                        text_pages.extend(pages)
+                        extract_seconds += elapsed
+                    outcome['timings']['extract_seconds'] = round(extract_seconds, 3)
+                    outcome['pages'] = len(text_pages)
+                    if not text_pages:
+                        outcome['error'] = 'No text extracted from PDF'
+                        parse_futures.append(None)
+                        continue
+                    parse_futures.append(pool.submit(_parse_job, text_pages, regulation_type))
+                except Exception as e:
+                    outcome['error'] = str(e)
+                    outcome['transient'] = isinstance(e, TRANSIENT_INGEST_ERRORS)
+                    parse_futures.append(None)
+
+            for outcome, future in zip(outcomes, parse_futures):
+                if future is not None:
+                    try:
+                        outcome['rules'], elapsed = future.result()
+                        outcome['timings']['parse_seconds'] = round(elapsed, 3)
+                    except Exception as e:
+                        outcome['error'] = str(e)
+                        outcome['transient'] = isinstance(e, TRANSIENT_INGEST_ERRORS)
+                yield outcome
+
+    def _file_sha256(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _verified_manifest(self, manifest):
+        """Manifest entries whose recorded rules are all still stored; files without one are re-ingested"""
+        verified = {}
+        for pdf_file, entry in manifest.items():
+            rule_ids = list(set(entry.get('rule_ids') or []))
+            if rule_ids and self.db.rules.count_documents({'rule_id': {'$in': rule_ids}}) < len(rule_ids):
+                print(f"Rules from {pdf_file} are missing from the database; it will be re-ingested")
+                continue
+            verified[pdf_file] = entry
+        return verified
+
+    def _changed_files(self, raw_data_folder, pdf_files, manifest, force):
+        """Split raw_data PDFs into (changed, unchanged) using the manifest's size, mtime and hash"""
+        changed = []
+        unchanged = []
+        for pdf_file in pdf_files:
+            pdf_path = os.path.join(raw_data_folder, pdf_file)
+            stat = os.stat(pdf_path)
+            entry = manifest.get(pdf_file)
+            fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime}
+            if not force and entry and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+                unchanged.append(pdf_file)
+                continue
+            fingerprint['sha256'] = self._file_sha256(pdf_path)
+            if not force and entry and entry.get('sha256') == fingerprint['sha256']:
+                # Touched but identical: remember the new mtime so the next run skips hashing
+                self.db.ingest_manifest.update_one({'file': pdf_file}, {'$set': fingerprint})
+                unchanged.append(pdf_file)
+                continue
+            changed.append((pdf_file, pdf_path, fingerprint))
+        return changed, unchanged
+
+    def _retire_rules(self, pdf_file, keep_rule_ids=()):
+        """Delete rules that came from pdf_file and are no longer produced by it"""
+        retired = list(self.db.rules.find(
+            {'source_file': pdf_file, 'rule_id': {'$nin': list(keep_rule_ids)}},
+            {'category': 1, 'subcategory': 1}
+        ))
+        if not retired:
+            return 0
+        self._ensure_summary_stats()
+        result = self.db.rules.delete_many({'_id': {'$in': [rule['_id'] for rule in retired]}})
+        if result.deleted_count == len(retired):
+            self._update_summary_stats(rule_increments(removed=retired))
+        else:
+            # Something else deleted some of them first; don't guess which
+            self._create_summary_stats()
+        return result.deleted_count
+
+    def _write_parallel_outcomes(self, outcomes, writer):
+        """Write each parallel-parsed file's rules as soon as its outcome is ready"""
+        for outcome in outcomes:
+            rules = outcome.pop('rules')
+            errors_before = writer.counts['errors']
+            for rule in rules:
+                rule['source_file'] = outcome['file']
+                writer.add(rule)
+            writer.flush()
+            if writer.counts['errors'] > errors_before:
+                outcome['store_error'] = True
+            outcome['rule_ids'] = [rule['rule_id'] for rule in rules]
+            yield outcome
+
+    def process_documents(self, workers=None, force=False, raw_data_folder=None):
+        """Stream new or changed PDF files from the raw_data folder into the database, tracked in the ingest_manifest collection"""
+        raw_data_folder = raw_data_folder or os.path.join(os.path.dirname(__file__), 'raw_data')
         processed_files = []
+        workers = max(1, min(INGEST_WORKERS if workers is None else workers, MAX_INGEST_WORKERS))
+        started = time.perf_counter()
         
         print(f"Looking for raw_data folder at: {raw_data_folder}")
         
         if not os.path.exists(raw_data_folder):
             return {"error": f"raw_data folder not found at {raw_data_folder}"}
         
-        pdf_files = [f for f in os.listdir(raw_data_folder) if f.endswith('.pdf')]
+        pdf_files = sorted(f for f in os.listdir(raw_data_folder) if f.endswith('.pdf'))
         
         if not pdf_files:
             return {"error": "No PDF files found in raw_data folder", "folder_contents": os.listdir(raw_data_folder)}
         
         print(f"Found {len(pdf_files)} PDF files: {pdf_files}")
         
-        all_rules_data = []  # Collect all rules from all files
+        self._create_indexes()
+        manifest = {entry['file']: entry for entry in self.db.ingest_manifest.find({})}
+        changed, unchanged = self._changed_files(raw_data_folder, pdf_files, self._verified_manifest(manifest), force)
+        removed = [pdf_file for pdf_file in manifest if pdf_file not in pdf_files]
+        fingerprints = {pdf_file: fingerprint for pdf_file, _, fingerprint in changed}
+        if unchanged:
+            print(f"Skipping {len(unchanged)} unchanged files: {unchanged}")
         
-        for pdf_file in pdf_files:
-            try:
-                pdf_path = os.path.join(raw_data_folder, pdf_file)
-                print(f"Processing {pdf_file}...")
-                
-                # Determine regulation type from filename
-                if 'technical' in pdf_file.lower():
-                    regulation_type = 'technical'
-                elif 'sporting' in pdf_file.lower():
-                    regulation_type = 'sporting'
-                elif 'financial' in pdf_file.lower():
-                    regulation_type = 'financial'
-                else:
-                    regulation_type = 'general'
-                
-                # Extract text from PDF
-                text_pages = self.extract_text_from_pdf(pdf_path)
-                
-                if not text_pages:
-                    processed_files.append({
-                        'file': pdf_file,
-                        'error': 'No text extracted from PDF',
-                        'status': 'error'
-                    })
-                    continue
-                
-                # Parse and structure the text
-                rules_data = self.parse_regulations_structure(text_pages, regulation_type)
-                
-                if not rules_data:
+        writer = RuleBatchWriter(self)
+        total_rules = 0
+        retired_count = 0
+        jobs = [
+            (pdf_file, pdf_path, self._regulation_type(pdf_file))
+            for pdf_file, pdf_path, _ in changed
+        ]
+        
+        if workers > 1 and jobs:
+            print(f"Processing {len(jobs)} files with {workers} worker processes...")
+            outcomes = self._write_parallel_outcomes(self._process_files_parallel(jobs, workers), writer)
+        else:
+            outcomes = (self._stream_file(*job, writer) for job in jobs)
+        
+        try:
+            # Each file's rules are already stored by the time its outcome arrives
+            for outcome in outcomes:
+                pdf_file = outcome['file']
+                total_rules += len(outcome['rule_ids'])
+                # Per-file stage times, measured where the work ran (possibly a worker process)
+                for name, seconds in outcome['timings'].items():
+                    if name in INGEST_STAGE_NAMES:
+                        metrics.observe_stage(INGEST_STAGE_NAMES[name], seconds)
+                entry = dict(fingerprints[pdf_file], file=pdf_file, regulation_type=outcome['regulation_type'],
+                             ingested_at=datetime.now().isoformat())
+                if 'error' not in outcome and not outcome['rule_ids']:
+                    outcome['error'] = 'No rules parsed from PDF'
+                if outcome.get('store_error'):
+                    outcome.setdefault('error', 'Some rules failed to store')
+                if 'error' in outcome:
+                    print(f"✗ Error processing {pdf_file}: {outcome['error']}")
                     processed_files.append({
                         'file': pdf_file,
-                        'error': 'No rules parsed from PDF',
-                        'status': 'error'
+                        'error': outcome['error'],
+                        'status': 'error',
+                        'retry': bool(outcome.get('store_error') or outcome.get('transient')),
+                        'timings': outcome['timings']
                     })
+                    # Record deterministic parse failures so an unchanged broken file is not re-parsed on
+                    # every run, keeping the ids of rules stored before the failure. Store failures and
+                    # transient errors leave the manifest untouched so the file is retried
+                    if not outcome.get('store_error') and not outcome.get('transient'):
+                        self.db.ingest_manifest.replace_one(
+                            {'file': pdf_file},
+                            dict(entry, status='error', error=outcome['error'], rule_ids=outcome['rule_ids']),
+                            upsert=True
+                        )
                     continue
                 
-                # Add to all rules data
-                all_rules_data.extend(rules_data)
-                
+                retired_count += self._retire_rules(pdf_file, outcome['rule_ids'])
+                self.db.ingest_manifest.replace_one(
+                    {'file': pdf_file},
+                    dict(entry, status='success', rule_ids=outcome['rule_ids']),
+                    upsert=True
+                )
                 processed_files.append({
                     'file': pdf_file,
-                    'regulation_type': regulation_type,
-                    'pages_processed': len(text_pages),
-                    'rules_processed': len(rules_data),
-                    'status': 'success'
+                    'regulation_type': outcome['regulation_type'],
+                    'pages_processed': outcome['pages'],
+                    'rules_processed': len(outcome['rule_ids']),
+                    'status': 'success',
+                    'timings': outcome['timings']
                 })
                 
-                print(f"✓ Processed {pdf_file}: {len(rules_data)} rules extracted")
-                
-            except Exception as e:
-                print(f"✗ Error processing {pdf_file}: {str(e)}")
-                processed_files.append({
-                    'file': pdf_file,
-                    'error': str(e),
-                    'status': 'error'
-                })
-        
-        # Store all rules at once
-        if all_rules_data:
-            try:
-                stored_count = self.store_in_database(all_rules_data)
-                print(f"✓ Stored {stored_count} total rules in database")
-            except Exception as e:
-                print(f"✗ Error storing rules in database: {str(e)}")
-                return {
-                    'error': f'Failed to store rules: {str(e)}',
-                    'processed_files': processed_files
-                }
+                print(f"✓ Processed {pdf_file}: {len(outcome['rule_ids'])} rules extracted")
+            
+            for pdf_file in removed:
+                retired_count += self._retire_rules(pdf_file)
+                self.db.ingest_manifest.delete_one({'file': pdf_file})
+            if retired_count:
+                print(f"✓ Retired {retired_count} rules from changed or removed files")
+                self.search_cache.invalidate()
+            if force:
+                # A forced run also reconciles the write-time summary counts
+                self._create_summary_stats()
+            if writer.counts['inserted'] or writer.counts['updated'] or retired_count:
+                self.build_search_index()
+            elif self.search_index is None:
+                self.build_search_index()
+        except Exception as e:
+            print(f"✗ Error storing rules in database: {str(e)}")
+            return {
+                'error': f'Failed to store rules: {str(e)}',
+                'processed_files': processed_files
+            }
         
         return {
             'processed_files': processed_files,
+            'skipped_files': unchanged,
+            'removed_files': removed,
             'total_files': len(pdf_files),
             'successful': len([f for f in processed_files if f['status'] == 'success']),
-            'total_rules_stored': len(all_rules_data)
+            'total_rules_stored': total_rules,
+            'store': writer.counts,
+            'retired_rules': retired_count,
+            'workers': workers,
+            'elapsed_seconds': round(time.perf_counter() - started, 3)
         }
 
     def test_embedding_model(self):
@@ -481,12 +1104,94 @@ class RuleBoxF1Processor:
                 print("✗ Embedding model is disabled")
                 return False
             test_text = "This is a test sentence for the embedding model."
-            # embedding = self.embedding_model.encode(test_text)
-            # print(f"✓ Embedding model working. Embedding shape: {embedding.shape}")
-            print("✓ Embedding model test skipped (disabled)")
+            embedding = self.embedding_model.encode(test_text)
+            if not np.isclose(np.linalg.norm(embedding), 1.0):
+                print("✗ Embedding model returned an unnormalised vector")
+                return False
+            print(f"✓ Embedding model working. Embedding shape: {embedding.shape}")
             return True
         except Exception as e:
             print(f"✗ Embedding model error: {e}")
             return False
 
-    # ...existing code...
\ No newline at end of file
+
+class RuleBatchWriter:
+    """Buffers rules and writes them through store_in_database in STORE_BATCH_SIZE batches"""
+
+    def __init__(self, processor, batch_size=None):
+        self.processor = processor
+        self.batch_size = batch_size or STORE_BATCH_SIZE
+        self.pending = []
+        self.counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+
+    def add(self, rule):
+        self.pending.append(rule)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        result = self.processor.store_in_database(self.pending, self.batch_size)
+        for key, value in result.items():
+            self.counts[key] += value
+        self.pending = []
+
+
+def _bounded(iterable, maxsize=INGEST_QUEUE_SIZE):
+    """Run an iterable in a background thread, handing items over through a bounded queue"""
+    handoff = queue.Queue(maxsize=maxsize)
+    stopped = threading.Event()
+
+    def put(item):
+        # Give up if the consumer has gone away instead of blocking forever on a full queue
+        while not stopped.is_set():
+            try:
+                handoff.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((True, item)):
+                    return
+        except Exception as e:
+            put((False, e))
+            return
+        put((False, None))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            has_item, item = handoff.get()
+            if not has_item:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
+_worker_processor = None
+
+def _get_worker_processor():
+    global _worker_processor
+    if _worker_processor is None:
+        _worker_processor = RuleBoxF1Processor(connect=False)
+    return _worker_processor
+
+def _extract_pages_job(pdf_path, first_page, last_page):
+    """Process-pool job: extract text from a page range of one PDF"""
+    started = time.perf_counter()
+    text_pages = _get_worker_processor().extract_text_from_pdf(pdf_path, first_page, last_page)
+    return text_pages, time.perf_counter() - started
+
+def _parse_job(text_pages, regulation_type):
+    """Process-pool job: parse the merged pages of one PDF into rules"""
+    started = time.perf_counter()
+    rules = _get_worker_processor().parse_regulations_structure(text_pages, regulation_type)
+    return rules, time.perf_counter() - started
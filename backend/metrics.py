@@ -0,0 +1,207 @@
+"""In-process counters and histograms, exported in the Prometheus text format.
+
+Recording is a lock, a bisect and two additions, cheap enough to leave on in
+production. Set METRICS_ENABLED=false to turn recording into a no-op.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
+# Seconds; spans sub-millisecond cache hits up to multi-second LLM calls and ingest stages
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f'{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (non-cumulative, last is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                bucket_labels = _format_labels(labels + [('le', _format_value(float(bound)))])
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Metrics rendered on /metrics, plus collectors that read existing stats at scrape time"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """collector() returns (name, type, help, [(labels dict, value), ...]) tuples"""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'rulebox_http_request_duration_seconds', 'HTTP request latency by route, method and status.',
+    ('method', 'route', 'status')
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'rulebox_stage_duration_seconds', 'Time spent in each search, Mongo, LLM and ingest stage.', ('stage',)
+))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    'rulebox_stage_errors_total', 'Stages that ended with an exception.', ('stage',)
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'rulebox_cache_requests_total', 'Cache lookups by cache and result.', ('cache', 'result')
+))
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one observation of `name`, counting it as an error if it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request until its response has been fully sent.
+
+    Requests are labelled with the route template rather than the raw path so
+    the label set stays bounded; unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get('route')
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope['method'],
+                route=getattr(route, 'path', 'unmatched'),
+                status=status[0]
+            )
+
+
+def observe_stage(name, seconds):
+    """Record a stage timed elsewhere, e.g. in an ingest worker process"""
+    STAGE_SECONDS.observe(seconds, stage=name)
+
+
+def cache_result(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
@@ -0,0 +1,316 @@
+"""Opt-in wall-clock sampling profiler for individual HTTP requests.
+
+A request is profiled when an admin sends the PROFILER_HEADER header, or at
+random with probability sample_rate. While any profile is active, one
+background thread samples stacks every PROFILER_INTERVAL_MS and counts them
+into per-request folded stacks ("root;caller;callee count" lines), which
+flamegraph.pl, speedscope and inferno read directly. When no request is
+being profiled the thread is parked and requests pay only a header lookup.
+While the event loop is CPU-bound, samples arrive at most once per
+sys.getswitchinterval(), since the sampler needs the GIL.
+
+A request's tasks are the one serving it plus every task it creates,
+tracked through a loop task factory installed with the first profile
+(coalesced calls, batch fan-out, streaming bodies). Event loop samples
+count only while one of those tasks is running. Each suspended task adds
+its await chain under an [awaiting] leaf, so time spent waiting on Mongo or
+the LLM shows up too. Busy executor threads (bcrypt, run_in_executor) are
+added under a thread:<name> root; with several requests in flight those
+samples may include other requests' work.
+"""
+import asyncio
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+PROFILER_SAMPLE_RATE = float(os.getenv('PROFILER_SAMPLE_RATE', '0'))
+PROFILER_INTERVAL_MS = float(os.getenv('PROFILER_INTERVAL_MS', '5'))
+PROFILER_MAX_PROFILES = int(os.getenv('PROFILER_MAX_PROFILES', '20'))
+# Sampling stops for a profile after this long, bounding its memory
+PROFILER_MAX_SECONDS = float(os.getenv('PROFILER_MAX_SECONDS', '30'))
+PROFILER_HEADER = os.getenv('PROFILER_HEADER', 'X-Profile')
+
+# An executor thread whose innermost frame is in one of these is waiting for work
+IDLE_FILES = ('threading.py', 'queue.py', 'thread.py')
+
+
+def _label(code):
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _frame_stack(frame):
+    """Labels from the outermost frame to `frame`"""
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _executor_work(frame):
+    """Stack of an executor worker thread that is running a job, or None if it is idle or not a worker"""
+    if os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+        return None
+    stack = _frame_stack(frame)
+    # concurrent.futures workers (run_in_executor, bcrypt) and anyio's threadpool
+    if any(label.startswith(('_worker (thread.py', 'WorkerThread.run (')) for label in stack):
+        return stack
+    return None
+
+
+def _task_frames(frame):
+    """The running task's part of the loop thread's stack, without the event loop machinery"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        # Handle._run in asyncio/events.py is where the loop steps into the task
+        if code.co_name == '_run' and code.co_filename.endswith(os.path.join('asyncio', 'events.py')):
+            break
+        stack.append(_label(code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _await_stack(task):
+    """Where a suspended task is waiting, following its chain of awaited coroutines"""
+    labels = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, 'cr_frame', None) or getattr(awaitable, 'gi_frame', None) \
+            or getattr(awaitable, 'ag_frame', None)
+        if frame is None:
+            break
+        labels.append(_label(frame.f_code))
+        awaitable = getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'gi_yieldfrom', None) \
+            or getattr(awaitable, 'ag_await', None)
+    labels.append('[awaiting]')
+    return labels
+
+
+class Profile:
+    def __init__(self, profile_id, method, path, reason):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.status = None
+        self.samples = 0
+        self.truncated = False
+        self.stacks = Counter()
+        # The request task, then every task created from it
+        self.tasks = []
+
+    def summary(self):
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'reason': self.reason,
+            'started_at': self.started_at,
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'samples': self.samples,
+            'truncated': self.truncated
+        }
+
+    def folded(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class SamplingProfiler:
+    """Samples stacks for the requests currently being profiled and keeps the last max_profiles results"""
+
+    def __init__(self, interval=0.005, max_profiles=20, max_seconds=30.0, sample_rate=0.0):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.sample_rate = sample_rate
+        self.profiles = deque(maxlen=max_profiles)
+        self._active = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._loop_thread = None
+        self._task_profiles = {}
+        self._previous_factory = None
+
+    def should_sample(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self, method, path, reason):
+        """Begin profiling the current request; call from its task on the event loop"""
+        profile = Profile(next(self._ids), method, path, reason)
+        task = asyncio.current_task()
+        profile.tasks.append(task)
+        self._task_profiles[task] = profile
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._previous_factory = loop.get_task_factory()
+            loop.set_task_factory(self._task_factory)
+        with self._lock:
+            self._loop = loop
+            self._loop_thread = threading.get_ident()
+            self._active[profile.id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+                self._thread.start()
+            self._wake.set()
+        return profile
+
+    def _task_factory(self, loop, coro, **kwargs):
+        """Create tasks as usual, adding those started by a profiled task to its profile"""
+        if self._previous_factory is not None:
+            task = self._previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        if self._task_profiles:
+            profile = self._task_profiles.get(asyncio.current_task(loop))
+            if profile is not None:
+                profile.tasks.append(task)
+                self._task_profiles[task] = profile
+        return task
+
+    def stop(self, profile, status):
+        profile.duration_ms = round((time.perf_counter() - profile.started) * 1000, 1)
+        profile.status = status
+        for task in profile.tasks:
+            self._task_profiles.pop(task, None)
+        # Kept profiles must not hold on to finished tasks, their coroutines and frames
+        profile.tasks = []
+        with self._lock:
+            self._active.pop(profile.id, None)
+            self.profiles.append(profile)
+            if not self._active:
+                self._wake.clear()
+
+    def get(self, profile_id):
+        with self._lock:
+            for profile in self.profiles:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+    def summaries(self):
+        with self._lock:
+            return [profile.summary() for profile in reversed(self.profiles)]
+
+    def merged_folded(self, path=None):
+        """All kept profiles, optionally for one path, as a single folded-stack file"""
+        merged = Counter()
+        with self._lock:
+            for profile in self.profiles:
+                if path is None or profile.path == path:
+                    merged.update(profile.stacks)
+        return ''.join(f"{stack} {count}\n" for stack, count in merged.most_common())
+
+    def config(self):
+        return {
+            'sample_rate': self.sample_rate,
+            'interval_ms': round(self.interval * 1000, 3),
+            'max_profiles': self.profiles.maxlen,
+            'max_seconds': self.max_seconds,
+            'header': PROFILER_HEADER,
+            'active': len(self._active)
+        }
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.interval)
+            try:
+                self._sample()
+            except Exception as e:
+                print(f"Profiler sample failed: {e}")
+
+    def _sample(self):
+        with self._lock:
+            active = list(self._active.values())
+        if not active:
+            return
+        frames = sys._current_frames()
+        running = asyncio.current_task(self._loop) if self._loop is not None else None
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        workers = []
+        for ident, frame in frames.items():
+            if ident in (self._loop_thread, threading.get_ident()):
+                continue
+            stack = _executor_work(frame)
+            if stack:
+                workers.append(';'.join([f"thread:{names.get(ident, ident)}"] + stack))
+
+        now = time.perf_counter()
+        samples = []
+        for profile in active:
+            if now - profile.started > self.max_seconds:
+                profile.truncated = True
+                continue
+            stacks = list(workers)
+            for task in list(profile.tasks):
+                if task is running:
+                    stacks.append(';'.join(_task_frames(frames.get(self._loop_thread))))
+                elif not task.done():
+                    stacks.append(';'.join(_await_stack(task)))
+            samples.append((profile, stacks))
+
+        with self._lock:
+            for profile, stacks in samples:
+                # Skip profiles that finished while this sample was being taken
+                if profile.id not in self._active:
+                    continue
+                profile.samples += 1
+                profile.stacks.update(stacks)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware that profiles sampled requests and those an admin asks for with the profiler header.
+
+    await authorize(scope) decides whether the header is honoured. Requests to
+    skip_prefixes (the profile download endpoints, /metrics) are never profiled.
+    """
+
+    def __init__(self, app, profiler, authorize, skip_prefixes=()):
+        self.app = app
+        self.profiler = profiler
+        self.authorize = authorize
+        self.skip_prefixes = tuple(skip_prefixes)
+        self.header = PROFILER_HEADER.lower().encode('latin-1')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+        requested = any(name == self.header and value not in (b'', b'0', b'false')
+                        for name, value in scope['headers'])
+        if requested and await self.authorize(scope):
+            reason = 'header'
+        elif self.profiler.should_sample():
+            reason = 'sampled'
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        profile = self.profiler.start(scope['method'], scope['path'], reason)
+        status = [500]
+
+        async def send_profiled(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+                if reason == 'header':
+                    headers = list(message.get('headers', [])) + [(b'x-profile-id', str(profile.id).encode())]
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            self.profiler.stop(profile, status[0])
@@ -0,0 +1,98 @@
+import re
+from collections import Counter
+
+# Article headers, tried in priority order as alternatives of a single compiled pattern
+HEADER_PATTERN = re.compile(
+    r'\bARTICLE\s+(?P<n1>\d+(?:\.\d+)?)\s*[:\-–—]?\s*(?P<t1>.+?)(?=\n|\r|$)'
+    r'|^(?P<n2>\d+(?:\.\d+)?)\s+(?P<t2>.+?)(?=\n|\r|$)'
+    r'|\b(?P<n3>\d+(?:\.\d+)?)\s*\.\s*(?P<t3>.+?)(?=\n|\r|$)',
+    re.IGNORECASE
+)
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+DISALLOWED_PATTERN = re.compile(r'[^\w\s.,():\-–—/\[\]{}"]')
+WORD_PATTERN = re.compile(r'\b[a-z]{3,}\b')
+
+# Each pattern is paired with literals it cannot match without, so the common
+# case (no penalty or example wording at all) costs a few substring checks on
+# already-lowercased text instead of a regex sweep per pattern.
+PENALTY_PATTERNS = [
+    (('second', 'penalty'), re.compile(r'(\d+)\s*second[s]?\s*time\s*penalty', re.IGNORECASE)),
+    (('place', 'penalty'), re.compile(r'(\d+)\s*place[s]?\s*grid\s*penalty', re.IGNORECASE)),
+    (('drive', 'penalty'), re.compile(r'drive.through\s*penalty', re.IGNORECASE)),
+    (('stop', 'penalty'), re.compile(r'stop.and.go\s*penalty', re.IGNORECASE)),
+    (('disqualification',), re.compile(r'disqualification', re.IGNORECASE)),
+    (('reprimand',), re.compile(r'reprimand', re.IGNORECASE))
+]
+EXAMPLE_PATTERNS = [
+    (('for example',), re.compile(r'for example[,:]?\s*([^.]+\.)', re.IGNORECASE)),
+    (('such as',), re.compile(r'such as[,:]?\s*([^.]+\.)', re.IGNORECASE)),
+    (('including',), re.compile(r'including[,:]?\s*([^.]+\.)', re.IGNORECASE))
+]
+
+F1_TERMS = {
+    'aerodynamic', 'downforce', 'drs', 'power unit', 'ers', 'kers',
+    'qualifying', 'grid', 'safety car', 'pit stop', 'penalty',
+    'championship', 'points', 'constructor', 'driver', 'team',
+    'engine', 'gearbox', 'suspension', 'brake', 'tire', 'tyre',
+    'fuel', 'weight', 'ballast', 'scrutineering', 'parc ferme'
+}
+
+
+def match_article_header(line):
+    """Return (article_number, title) if the line starts an article, else None"""
+    match = HEADER_PATTERN.match(line)
+    if not match:
+        return None
+    if match.group('n1') is not None:
+        return match.group('n1'), match.group('t1')
+    if match.group('n2') is not None:
+        return match.group('n2'), match.group('t2')
+    return match.group('n3'), match.group('t3')
+
+
+def clean_text(text):
+    text = WHITESPACE_PATTERN.sub(' ', text)
+    text = DISALLOWED_PATTERN.sub('', text)
+    return text.strip()
+
+
+def extract_keywords(lowered_text, limit=10):
+    """Most frequent F1 terms and long words in already-lowercased text"""
+    counts = Counter(
+        word for word in WORD_PATTERN.findall(lowered_text)
+        if word in F1_TERMS or len(word) > 4
+    )
+    return [word for word, _ in counts.most_common(limit)]
+
+
+def scan_features(content, lowered=None, max_examples=3):
+    """Collect penalties and examples from cleaned content, skipping patterns whose literals are absent"""
+    if lowered is None:
+        lowered = content.lower()
+    penalties = []
+    for literals, pattern in PENALTY_PATTERNS:
+        if all(literal in lowered for literal in literals):
+            penalties.extend(match.group(0) for match in pattern.finditer(content))
+    examples = []
+    for literals, pattern in EXAMPLE_PATTERNS:
+        if len(examples) >= max_examples:
+            break
+        if all(literal in lowered for literal in literals):
+            examples.extend(match.group(1).strip() for match in pattern.finditer(content))
+    return penalties, examples[:max_examples]
+
+
+def scan_rule(title, content):
+    """Clean a rule and extract everything _create_rule_object needs from it"""
+    clean_content = clean_text(content)
+    lowered = f"{title} {clean_content}".lower()
+    penalties, examples = scan_features(clean_content, lowered)
+    return {
+        'title': clean_text(title),
+        'content': clean_content,
+        'lowered': lowered,
+        'keywords': extract_keywords(lowered),
+        'penalties': penalties,
+        'examples': examples
+    }
@@ -0,0 +1,119 @@
+import heapq
+import math
+import re
+import unicodedata
+from array import array
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has',
+    'in', 'is', 'it', 'its', 'of', 'on', 'or', 'that', 'the', 'this', 'to',
+    'was', 'were', 'will', 'with', 'what', 'which', 'who', 'how', 'does', 'do'
+}
+
+
+def tokenize(text):
+    """Lowercase, accent-folded word tokens with stopwords removed"""
+    folded = unicodedata.normalize('NFKD', text.lower()).encode('ascii', 'ignore').decode('ascii')
+    return [t for t in TOKEN_PATTERN.findall(folded) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """In-memory inverted index over rule documents, ranked with BM25"""
+
+    def __init__(self, k1=1.2, b=0.75, title_weight=2):
+        self.k1 = k1
+        self.b = b
+        self.title_weight = title_weight
+        self.documents = []
+        self._postings = {}
+        self._norms = array('f')
+        self._avg_length = 0.0
+
+    @classmethod
+    def from_rules(cls, rules, **kwargs):
+        index = cls(**kwargs)
+        index.build(rules)
+        return index
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _document_terms(self, rule):
+        metadata = rule.get('metadata') or {}
+        terms = tokenize(rule.get('title', '')) * self.title_weight
+        terms += tokenize(rule.get('content', ''))
+        terms += tokenize(' '.join(metadata.get('keywords') or []))
+        return terms
+
+    def build(self, rules):
+        term_freqs = {}
+        lengths = []
+        documents = []
+        for doc_id, rule in enumerate(rules):
+            terms = self._document_terms(rule)
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, tf in counts.items():
+                term_freqs.setdefault(term, []).append((doc_id, tf))
+            lengths.append(len(terms))
+            documents.append(rule)
+
+        # Postings are stored as parallel arrays of doc ids and term frequencies
+        postings = {}
+        for term, entries in term_freqs.items():
+            postings[term] = (
+                array('I', (doc_id for doc_id, _ in entries)),
+                array('I', (tf for _, tf in entries))
+            )
+
+        avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        norms = array('f', (
+            self.k1 * (1 - self.b + self.b * (length / avg_length if avg_length else 0))
+            for length in lengths
+        ))
+
+        self.documents = documents
+        self._postings = postings
+        self._norms = norms
+        self._avg_length = avg_length
+
+    def _idf(self, doc_freq):
+        total = len(self.documents)
+        return math.log(1 + (total - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def score(self, query):
+        """Return a {doc_id: score} map for documents matching any query term"""
+        scores = {}
+        norms = self._norms
+        k1_plus_one = self.k1 + 1
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            doc_ids, tfs = posting
+            idf = self._idf(len(doc_ids))
+            for doc_id, tf in zip(doc_ids, tfs):
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * k1_plus_one / (tf + norms[doc_id])
+        return scores
+
+    def top(self, query, limit=10, category_filter=None):
+        """Return the best (doc_id, score) pairs for a query"""
+        scores = self.score(query)
+        if category_filter:
+            wanted = category_filter.lower()
+            scores = {
+                doc_id: score for doc_id, score in scores.items()
+                if str(self.documents[doc_id].get('category', '')).lower() == wanted
+            }
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def search(self, query, limit=10, category_filter=None):
+        results = []
+        for doc_id, score in self.top(query, limit, category_filter):
+            rule = dict(self.documents[doc_id])
+            rule['score'] = round(score, 4)
+            results.append(rule)
+        return results
@@ -0,0 +1,48 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key onto one in-flight task.
+
+    The first caller for a key (the leader) starts the work; callers arriving
+    while it runs await the same task and share its result or exception.
+    The task is cancelled only once every caller waiting on it is cancelled.
+    Results are shared objects, so callers must not mutate them.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._waiters = {}
+        self.calls = 0
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, factory):
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            # Shield so one caller disconnecting doesn't cancel the work for the others
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                # No caller is left to use the result, so stop the work (a no-op once it is done)
+                task.cancel()
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'upstream_calls': self.leaders,
+            'coalesced': self.coalesced,
+            'coalesce_rate': round(self.coalesced / self.calls, 4) if self.calls else 0.0,
+            'in_flight': len(self._inflight)
+        }
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from admission import AdmissionController, RateLimiter
+
+
+def test_full_queue_is_rejected_at_once():
+    admission = AdmissionController(max_concurrent=1, max_queue=0)
+
+    async def run():
+        async with admission.slot():
+            with pytest.raises(HTTPException) as rejected:
+                admission.check()
+            return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.status_code == 429 and rejected.headers['Retry-After'] == '1'
+    assert admission.rejected['queue_full'] == 1 and admission.active == 0
+
+
+def test_waiters_time_out_with_503():
+    admission = AdmissionController(max_concurrent=1, max_queue=4, queue_timeout=0.01)
+
+    async def run():
+        async with admission.slot():
+            with pytest.raises(HTTPException) as rejected:
+                async with admission.slot():
+                    pass
+            return rejected.value
+
+    assert asyncio.run(run()).status_code == 503
+    assert admission.rejected['queue_timeout'] == 1 and admission.waiting == 0
+
+
+def test_user_quota_limits_each_user_separately():
+    admission = AdmissionController(user_quota=2, quota_window=60)
+
+    async def run():
+        for _ in range(2):
+            await admission.call(lambda: asyncio.sleep(0), user='alice')
+        await admission.call(lambda: asyncio.sleep(0), user='bob')
+        with pytest.raises(HTTPException) as rejected:
+            await admission.call(lambda: asyncio.sleep(0), user='alice')
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.status_code == 429 and int(rejected.headers['Retry-After']) > 0
+    assert admission.admitted == 3
+
+
+def test_calls_past_the_deadline_fail_with_504():
+    admission = AdmissionController(request_timeout=0.01)
+
+    async def run():
+        with pytest.raises(HTTPException) as rejected:
+            await admission.call(lambda: asyncio.sleep(1))
+        return rejected.value
+
+    assert asyncio.run(run()).status_code == 504
+    assert admission.deadline_exceeded == 1 and admission.stats()['active'] == 0
+
+
+def test_rate_limiter_spaces_call_starts():
+    async def run(limiter, calls):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        starts = []
+        for _ in range(calls):
+            await limiter.wait()
+            starts.append(loop.time() - started)
+        return starts
+
+    starts = asyncio.run(run(RateLimiter(20, per=1.0), 3))
+    assert starts[1] >= 0.04 and starts[2] >= 0.09
+    assert asyncio.run(run(RateLimiter(0), 3))[-1] < 0.01
@@ -0,0 +1,177 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import ai_functions
+import app as app_module
+from admission import AdmissionController
+from conversation_store import ConversationStore
+from singleflight import SingleFlight
+
+
+class FakeStream:
+    def __init__(self, tokens):
+        self.tokens = list(tokens)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.tokens:
+            raise StopAsyncIteration
+        await asyncio.sleep(0)
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=self.tokens.pop(0)))])
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeCompletions:
+    """chat.completions of an AsyncOpenAI client, answering after `delay` seconds"""
+
+    def __init__(self, delay=0.0, tokens=('A black flag ', 'means ', 'disqualification.')):
+        self.delay = delay
+        self.tokens = tokens
+        self.calls = 0
+        self.active = 0
+
+    async def create(self, model, messages, max_tokens, temperature, stream=False):
+        self.calls += 1
+        self.active += 1
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        if stream:
+            return FakeStream(self.tokens)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=''.join(self.tokens)))])
+
+
+@pytest.fixture
+def fake_ai(monkeypatch):
+    """Point ai_functions at a fake model with no answer cache, context or shared state from other tests"""
+    completions = FakeCompletions()
+
+    async def no_context(query, context_rules):
+        return context_rules or []
+
+    monkeypatch.setattr(ai_functions, 'ai_client', SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(ai_functions, 'answer_cache', None)
+    monkeypatch.setattr(ai_functions, 'ai_flight', SingleFlight())
+    monkeypatch.setattr(ai_functions, 'ai_admission', AdmissionController())
+    monkeypatch.setattr(ai_functions, 'conversation_store', ConversationStore())
+    monkeypatch.setattr(ai_functions, '_retrieve_context', no_context)
+    return completions
+
+
+def ask_together(first, second):
+    """Two users asking the same question at once, so the second joins the first's flight"""
+    async def ask(user):
+        try:
+            return (await ai_functions.ai_query('What does a black flag mean?', user=user))['response']
+        except HTTPException as e:
+            return e.status_code
+
+    async def run():
+        return await asyncio.gather(ask(first), ask(second))
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('leader', ['alice', 'bob'])
+def test_quota_is_charged_per_caller_of_a_coalesced_query(fake_ai, monkeypatch, leader):
+    fake_ai.delay = 0.01
+    admission = AdmissionController(user_quota=1, quota_window=60)
+    monkeypatch.setattr(ai_functions, 'ai_admission', admission)
+    admission.charge('alice')
+
+    other = 'bob' if leader == 'alice' else 'alice'
+    results = dict(zip((leader, other), ask_together(leader, other)))
+    # Over-quota alice is rejected whether she leads or follows; bob is answered either way
+    assert results == {'alice': 429, 'bob': 'A black flag means disqualification.'}
+    assert fake_ai.calls == 1
+
+
+class RecordingRules:
+    def __init__(self):
+        self.filters = []
+
+    def find(self, query, projection):
+        self.filters.append(query)
+        return self
+
+    def sort(self, *args):
+        return self
+
+    def limit(self, limit):
+        return self
+
+    async def to_list(self, length):
+        return []
+
+
+def test_batch_text_search_ignores_phrase_and_negation_syntax(monkeypatch):
+    rules = RecordingRules()
+    monkeypatch.setattr(ai_functions, 'async_rules_collection', rules)
+
+    queries = ['"blue flag" rules', '-penalty for speeding', '""']
+    candidates = asyncio.run(ai_functions._retrieve_context_batch(queries))
+
+    assert rules.filters == [{'$text': {'$search': 'blue flag rules penalty speeding'}}]
+    assert set(candidates) == set(queries)
+
+
+def post(path, body):
+    async def run():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.post(path, json=body)
+    return asyncio.run(run())
+
+
+def test_stream_sends_token_events_then_done_with_ttft(fake_ai):
+    fake_ai.delay = 0.02
+    response = post('/api/ai-query/stream', {'query': 'What does a black flag mean?'})
+    assert response.headers['content-type'].startswith('text/event-stream')
+
+    events = []
+    for block in response.text.strip().split('\n\n'):
+        name, data = block.split('\n')
+        event = json.loads(data[len('data: '):])
+        assert name == f"event: {event['type']}"
+        events.append(event)
+    assert [event['type'] for event in events] == ['token', 'token', 'token', 'done']
+    done = events[-1]
+    assert ''.join(event['content'] for event in events[:-1]) == done['response'] == 'A black flag means disqualification.'
+    assert 20 <= done['ttft_ms'] <= done['total_ms'] and done['cached'] is False
+
+
+class SlowOnSomeQuestions(FakeCompletions):
+    async def create(self, model, messages, max_tokens, temperature, stream=False):
+        self.delay = 0.05 if 'slow' in messages[-1]['content'] else 0.0
+        return await super().create(model, messages, max_tokens, temperature, stream)
+
+
+def test_batch_answers_duplicates_once_and_streams_lines_as_they_complete(fake_ai, monkeypatch):
+    completions = SlowOnSomeQuestions()
+    monkeypatch.setattr(ai_functions, 'ai_client', SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+
+    async def no_candidates(queries, search_index=None):
+        return {query: [] for query in queries}
+    monkeypatch.setattr(ai_functions, '_retrieve_context_batch', no_candidates)
+
+    queries = ['A slow question', 'A fast question', 'a SLOW  question']
+    response = post('/api/ai-query/batch', {'queries': queries})
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    events = [json.loads(line) for line in response.text.splitlines()]
+
+    assert completions.calls == 2
+    assert [(event['type'], event.get('index')) for event in events] == [
+        ('result', 1), ('result', 0), ('result', 2), ('done', None)
+    ]
+    assert [event['query'] for event in events[:3]] == [queries[1], queries[0], queries[2]]
+    assert events[-1]['total'] == 3 and events[-1]['unique'] == 2 and events[-1]['errors'] == 0
@@ -0,0 +1,43 @@
+import asyncio
+
+from admission import AdmissionController
+
+
+class FakeSummaryClient:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def chat(self, model, messages, max_tokens=1000, temperature=0.3):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {'choices': [{'message': {'content': f"Summary {self.calls}"}}]}
+
+
+def test_summaries_wait_for_admission_instead_of_failing(make_db, make_processor):
+    db = make_db(count=4)
+    client = FakeSummaryClient(delay=0.01)
+    processor = make_processor(db, ai_client=client)
+    # One slot and no queue: every summary beyond the first is rejected with 429 at least once
+    admission = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=1)
+    progress = {}
+
+    async def run():
+        return await processor.generate_ai_summaries(rate_per_minute=0, admission=admission, progress=progress)
+
+    result = asyncio.run(run())
+    assert result['summarized'] == 4 and result['failed'] == 0
+    assert progress['summarized'] == 4
+    assert admission.admitted == 4 and admission.rejected['queue_full'] > 0
+    assert db.rules.count_documents({'metadata.ai_summary_hash': {'$exists': True}}) == 4
+
+
+def test_skipped_counts_only_rules_with_a_current_summary(make_db, make_processor):
+    db = make_db(count=6)
+    db.rules.update_one({'rule_id': 'rule-0'}, {'$set': {'metadata.ai_summary_hash': 'h0'}})
+    db.rules.update_one({'rule_id': 'rule-1'}, {'$set': {'metadata.ai_summary_hash': 'outdated'}})
+    processor = make_processor(db, ai_client=FakeSummaryClient())
+
+    result = asyncio.run(processor.generate_ai_summaries(rate_per_minute=0, limit=2))
+    # Five rules need a summary and two were done; the three left over are not "skipped"
+    assert result['summarized'] == 2 and result['skipped'] == 1
@@ -0,0 +1,52 @@
+import itertools
+
+import answer_cache
+from answer_cache import AnswerCache
+
+
+def make_cache(tmp_path, **kwargs):
+    return AnswerCache(str(tmp_path / 'answers.sqlite3'), **kwargs)
+
+
+def test_answers_persist_across_instances(tmp_path):
+    make_cache(tmp_path).put('key', 'A black flag means disqualification.')
+    cache = make_cache(tmp_path)
+    assert cache.get('key') == 'A black flag means disqualification.'
+    assert cache.get('missing') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_make_key_tracks_the_query_model_and_rule_versions(tmp_path):
+    cache = make_cache(tmp_path)
+    rules = [{'rule_id': 'a', 'metadata': {'content_hash': '1'}}, {'rule_id': 'b', 'metadata': {'content_hash': '2'}}]
+    key = cache.make_key('Black  flag?', 'model', rules)
+    assert key == cache.make_key('black flag?', 'model', rules[::-1])
+    assert key != cache.make_key('black flag?', 'other-model', rules)
+    assert key != cache.make_key('black flag?', 'model', [rules[0], dict(rules[1], metadata={'content_hash': '3'})])
+
+
+def test_expired_answers_are_dropped(tmp_path):
+    cache = make_cache(tmp_path, ttl=-1)
+    cache.put('key', 'stale')
+    assert cache.get('key') is None and cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_answers_are_evicted(tmp_path, monkeypatch):
+    # A strictly increasing clock, so access order never ties
+    clock = itertools.count(1_000_000)
+    monkeypatch.setattr(answer_cache.time, 'time', lambda: float(next(clock)))
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.put('a', '1')
+    cache.put('b', '2')
+    cache.get('a')
+    cache.put('c', '3')
+    assert cache.get('b') is None and cache.get('a') == '1' and cache.get('c') == '3'
+    assert cache.evictions == 1
+
+
+def test_invalidate_drops_every_answer(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put('a', '1')
+    cache.invalidate()
+    assert cache.get('a') is None
+    assert not make_cache(tmp_path, ttl=0).enabled
@@ -0,0 +1,25 @@
+import asyncio
+
+import httpx
+import pytest
+
+import app as app_module
+
+
+def post(path, content):
+    async def run():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.post(path, content=content, headers={'Content-Type': 'application/json'})
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('body, detail', [
+    ('{"query": ', 'Request body must be valid JSON.'),
+    ('["query"]', 'Request body must be a JSON object.'),
+])
+@pytest.mark.parametrize('path', ['/api/ai-query/stream', '/api/ai-query/batch'])
+def test_ai_endpoints_reject_a_malformed_body(path, body, detail):
+    response = post(path, body)
+    assert response.status_code == 400
+    assert response.json() == {'detail': detail}
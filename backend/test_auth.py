@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import auth
+from auth import AuthHandler
+
+
+@pytest.fixture
+def handler(async_db):
+    return AuthHandler(SimpleNamespace(rulebox_f1=async_db))
+
+
+def test_admin_rights_come_from_the_user_record(handler, mongo_db):
+    mongo_db.users.insert_many([
+        {'username': 'operator', 'is_admin': True},
+        {'username': 'admin'},
+        {'username': 'sneaky', 'is_admin': 'yes'}
+    ])
+
+    async def check(username):
+        return await handler.is_admin(username)
+
+    assert asyncio.run(check('operator'))
+    # A registered account named like an admin, or with a non-boolean flag, gets nothing
+    assert not asyncio.run(check('admin'))
+    assert not asyncio.run(check('sneaky'))
+    assert not asyncio.run(check('nobody'))
+    assert not asyncio.run(check(None))
+
+
+def test_token_round_trip_is_cached(handler):
+    token = handler.create_token({'username': 'alice'})
+    assert handler.verify_token(token) == (True, 'alice')
+    assert handler.verify_token(token) == (True, 'alice')
+    assert handler.token_cache.stats()['hits'] == 1
+    assert handler.verify_token(token + 'x')[0] is False
+
+
+class SlowHasher:
+    """Stands in for the bcrypt context, blocking its thread like a real hash"""
+
+    def __init__(self):
+        self.threads = []
+
+    def _work(self):
+        self.threads.append(threading.current_thread().name)
+        time.sleep(0.05)
+
+    def hash(self, password):
+        self._work()
+        return f'hashed:{password}'
+
+    def verify(self, password, hashed):
+        self._work()
+        return hashed == f'hashed:{password}'
+
+
+def test_hashing_runs_off_the_event_loop(handler, monkeypatch):
+    hasher = SlowHasher()
+    monkeypatch.setattr(auth, 'pwd_context', hasher)
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        assert (await handler.register_user('alice', 'secret', 'alice@example.com'))[0]
+        logins = await asyncio.gather(
+            handler.authenticate_user('alice', 'secret'), handler.authenticate_user('alice', 'wrong')
+        )
+        ticker.cancel()
+        return ticks, logins
+
+    ticks, logins = asyncio.run(run())
+    assert [ok for ok, _ in logins] == [True, False]
+    assert len(hasher.threads) == 3 and all(name.startswith('bcrypt') for name in hasher.threads)
+    # The loop kept running while the hashes blocked their threads
+    assert ticks >= 10
@@ -0,0 +1,91 @@
+import asyncio
+
+from cache import QueryCache, normalize_query
+from datacollect import RuleBoxF1Processor
+
+
+def test_make_key_normalizes_query_and_category():
+    cache = QueryCache()
+    assert normalize_query('  Safety   CAR ') == 'safety car'
+    assert cache.make_key('Safety  car', 'Sporting', 5) == cache.make_key('safety car', 'sporting', 5)
+
+
+def test_get_returns_copies_and_counts_hits():
+    cache = QueryCache()
+    cache.put('key', [{'rule_id': 'a'}])
+    result = cache.get('key')
+    result[0]['rule_id'] = 'changed'
+    assert cache.get('key') == [{'rule_id': 'a'}]
+    assert cache.get('other') is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_entries_expire_and_are_evicted_least_recently_used():
+    cache = QueryCache(max_entries=2, ttl=60)
+    cache.put('a', [])
+    cache.put('b', [])
+    cache.get('a')
+    cache.put('c', [])
+    assert cache.get('b') is None and cache.evictions == 1
+    cache.ttl = -1
+    cache.put('d', [])
+    assert cache.get('d') is None and cache.expirations == 1
+
+
+def test_invalidate_drops_everything():
+    cache = QueryCache()
+    cache.put('a', [{'rule_id': 'a'}])
+    cache.invalidate()
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0 and cache.stats()['bytes'] == 0
+
+
+def test_put_discards_results_computed_before_an_invalidation():
+    cache = QueryCache()
+    generation = cache.generation
+    cache.invalidate()
+    cache.put('a', [{'rule_id': 'old'}], generation)
+    assert cache.get('a') is None and cache.stale_puts == 1
+    cache.put('a', [{'rule_id': 'new'}], cache.generation)
+    assert cache.get('a') == [{'rule_id': 'new'}]
+
+
+class _SlowCursor:
+    """A Motor-like cursor whose results arrive only after `release` is set"""
+
+    def __init__(self, release):
+        self.release = release
+
+    def limit(self, limit):
+        return self
+
+    async def to_list(self, length=None):
+        await self.release.wait()
+        return [{'rule_id': 'old'}]
+
+
+class _SlowDatabase:
+    def __init__(self, release):
+        self.rules = self
+        self.release = release
+
+    def find(self, *args, **kwargs):
+        return _SlowCursor(self.release)
+
+
+def test_mongo_fallback_result_is_not_cached_across_an_invalidation():
+    processor = RuleBoxF1Processor(connect=False)
+
+    async def run():
+        release = asyncio.Event()
+        processor.async_db = _SlowDatabase(release)
+        search = asyncio.create_task(processor.async_semantic_search('safety car'))
+        await asyncio.sleep(0)
+        # Rules are stored while the fallback query is in flight
+        processor.search_cache.invalidate()
+        release.set()
+        return await search
+
+    assert asyncio.run(run()) == [{'rule_id': 'old'}]
+    assert processor.search_cache.stats()['entries'] == 0
+    assert processor.search_cache.stale_puts == 1
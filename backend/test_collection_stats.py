@@ -0,0 +1,72 @@
+import asyncio
+
+from benchmarks.memory_db import InMemoryDatabase
+from collection_stats import STATS_VERSION, read_collection_stats, rule_increments, summary_from_groups
+
+
+def test_rule_increments_net_out_moves():
+    added = [{'category': 'Sporting', 'subcategory': 'flags'}, {'category': 'Technical', 'subcategory': 'pu'}]
+    removed = [{'category': 'Sporting', 'subcategory': 'flags'}, {'category': 'Sporting', 'subcategory': 'pit.lane'}]
+    assert rule_increments(added, removed) == {
+        'categories.Technical': 1, 'subcategories.pu': 1, 'breakdown.Technical.pu': 1,
+        'categories.Sporting': -1, 'subcategories.pit_lane': -1, 'breakdown.Sporting.pit_lane': -1
+    }
+
+
+def recount(db):
+    return summary_from_groups(db.rules.aggregate([
+        {'$group': {'_id': {'category': '$category', 'subcategory': '$subcategory'}, 'count': {'$sum': 1}}}
+    ]))
+
+
+def stored_counts(db):
+    summary = db.summary.find_one({'type': 'rules_summary'})
+    counts = {key: summary[key] for key in ('total_rules', 'categories', 'subcategories', 'breakdown')}
+
+    def nonzero(value):
+        if isinstance(value, dict):
+            return {key: nonzero(item) for key, item in value.items() if item}
+        return value
+    return nonzero(counts)
+
+
+def test_write_time_counts_match_a_full_recount(make_processor, make_rules):
+    processor = make_processor(InMemoryDatabase())
+    rules = make_rules(3)
+    for rule in rules:
+        rule['source_file'] = 'sporting.pdf'
+    processor.store_in_database(rules)
+    assert stored_counts(processor.db) == recount(processor.db)
+    assert processor.db.summary.find_one({})['stats_version'] == STATS_VERSION
+
+    # Re-storing unchanged rules changes nothing; a rule moved to another category shifts one count
+    moved = [dict(rule, metadata=dict(rule['metadata'])) for rule in rules]
+    moved[0]['category'] = 'Financial'
+    processor.store_in_database(moved)
+    assert stored_counts(processor.db) == recount(processor.db)
+    assert stored_counts(processor.db)['total_rules'] == len(rules)
+    assert stored_counts(processor.db)['categories']['Financial'] == 4
+
+    processor._retire_rules('sporting.pdf', keep_rule_ids=[rule['rule_id'] for rule in rules[:5]])
+    assert stored_counts(processor.db) == recount(processor.db)
+    assert stored_counts(processor.db)['total_rules'] == 5
+
+
+def test_read_collection_stats_uses_the_summary_document(mongo_db, async_db):
+    db = mongo_db
+    db.rules.insert_many([{'rule_id': str(n)} for n in range(3)])
+    db.users.insert_one({'username': 'alice'})
+    stats = asyncio.run(read_collection_stats(async_db))
+    assert stats['rules']['source'] == 'estimated' and stats['rules']['total'] == 3
+
+    db.summary.insert_one({
+        'type': 'rules_summary', 'stats_version': STATS_VERSION, 'total_rules': 3,
+        'categories': {'Sporting': 3, 'Technical': 0}, 'subcategories': {'flags': 3},
+        'breakdown': {'Sporting': {'flags': 3}, 'Technical': {'pu': 0}}
+    })
+    stats = asyncio.run(read_collection_stats(async_db))
+    assert stats['rules']['source'] == 'summary'
+    assert stats['rules']['categories'] == {'Sporting': 3}
+    assert stats['rules']['breakdown'] == {'Sporting': {'flags': 3}}
+    assert stats['collections'] == {'rules': 3, 'users': 1, 'summary': 1}
+    assert stats['total_documents'] == 5
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from conversation_store import ConversationStore, truncate_to_budget, valid_conversation_id
+
+
+def message(role, content):
+    return {'role': role, 'content': content}
+
+
+@pytest.mark.parametrize('conversation_id', [{'$ne': None}, ['a'], 7, 'a' * 65, 'abc$', 'a.b'])
+def test_invalid_conversation_ids_are_rejected(conversation_id):
+    store = ConversationStore()
+    assert not valid_conversation_id(conversation_id)
+    with pytest.raises(ValueError):
+        asyncio.run(store.save(conversation_id, [message('user', 'hi')]))
+
+
+def test_conversations_are_scoped_by_user():
+    store = ConversationStore()
+    asyncio.run(store.save('chat-1', [message('user', 'alice asks')], user='alice'))
+    assert asyncio.run(store.get('chat-1', user='alice')) == [message('user', 'alice asks')]
+    assert asyncio.run(store.get('chat-1', user='mallory')) == []
+    assert asyncio.run(store.get('chat-1')) == []
+
+
+def test_mongo_conversations_are_scoped_by_user(mongo_db, async_db):
+    collection = mongo_db.conversations
+    store = ConversationStore(collection=async_db.conversations)
+    asyncio.run(store.save('chat-1', [message('user', 'alice asks')], user='alice'))
+    asyncio.run(store.save('chat-1', [message('user', 'bob asks')], user='bob'))
+    assert asyncio.run(store.get('chat-1', user='alice')) == [message('user', 'alice asks')]
+    assert asyncio.run(store.get('chat-1', user='bob')) == [message('user', 'bob asks')]
+    # An operator id never reaches the query, so it can't match other users' documents
+    with pytest.raises(ValueError):
+        asyncio.run(store.get({'$ne': None}, user='mallory'))
+    assert collection.count_documents({}) == 2
+
+
+def test_truncate_keeps_system_prompt_and_newest_messages():
+    messages = [message('system', 'rules'), message('user', 'a' * 400), message('assistant', 'b' * 40)]
+    assert truncate_to_budget(messages, 30) == [messages[0], messages[2]]
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = ConversationStore(max_conversations=2)
+    for conversation_id in ('one', 'two'):
+        asyncio.run(store.save(conversation_id, [message('user', conversation_id)]))
+    asyncio.run(store.get('one'))
+    asyncio.run(store.save('three', [message('user', 'three')]))
+    assert asyncio.run(store.get('two')) == []
+    assert asyncio.run(store.get('one')) and asyncio.run(store.get('three'))
+    assert store.stats()['evictions'] == 1
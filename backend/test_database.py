@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import database
+from database import TEXT_INDEX_FIELDS, TEXT_INDEX_NAME, ensure_indexes_sync, stale_text_indexes
+
+# As MongoDB reports them from index_information()
+LEGACY_TEXT_INDEX = {
+    'key': [('_fts', 'text'), ('_ftsx', 1)],
+    'weights': {'title': 1, 'content': 1},
+    'v': 2
+}
+CURRENT_TEXT_INDEX = {
+    'key': [('_fts', 'text'), ('_ftsx', 1)],
+    'weights': {field: 1 for field in TEXT_INDEX_FIELDS},
+    'v': 2
+}
+
+
+def test_stale_text_indexes_detects_old_key_spec_and_name():
+    assert stale_text_indexes({'_id_': {'key': [('_id', 1)]}, TEXT_INDEX_NAME: LEGACY_TEXT_INDEX}) == [TEXT_INDEX_NAME]
+    auto_named = 'title_text_content_text_metadata.keywords_text'
+    assert stale_text_indexes({auto_named: CURRENT_TEXT_INDEX}) == [auto_named]
+    assert stale_text_indexes({TEXT_INDEX_NAME: CURRENT_TEXT_INDEX, 'category_1': {'key': [('category', 1)]}}) == []
+
+
+def test_ensure_indexes_sync_replaces_the_legacy_text_index():
+    db = mongomock.MongoClient()['rulebox_test']
+    db.rules.create_index([('title', 'text'), ('content', 'text')], name=TEXT_INDEX_NAME)
+    assert ensure_indexes_sync(db)
+    text_index = db.rules.index_information()[TEXT_INDEX_NAME]
+    assert [field for field, _ in text_index['key']] == list(TEXT_INDEX_FIELDS)
+    assert stale_text_indexes(db.rules.index_information()) == []
+
+
+def test_ensure_indexes_migrates_and_becomes_ready(monkeypatch, mongo_db, async_db):
+    db = mongo_db
+    db.rules.create_index([('title', 'text'), ('content', 'text')], name=TEXT_INDEX_NAME)
+    monkeypatch.setattr(database, 'get_async_database', lambda: async_db)
+    monkeypatch.setattr(database, '_indexes_ready', False)
+    assert asyncio.run(database.ensure_indexes()) is not None
+    assert database._indexes_ready
+    assert stale_text_indexes(db.rules.index_information()) == []
+    assert asyncio.run(database.ensure_indexes()) is None
@@ -0,0 +1,131 @@
+import copy
+import itertools
+import time
+
+import pytest
+from PyPDF2.errors import PdfReadError
+
+import datacollect
+from benchmarks.ingest import generate_pages, write_pdf
+from benchmarks.memory_db import InMemoryDatabase
+from datacollect import RuleBoxF1Processor
+
+
+@pytest.fixture
+def ingest_processor(make_processor):
+    """Factory for a processor over an in-memory database, with a generated PDF in `folder`"""
+    def make(folder, fail_after=None, error=None):
+        write_pdf(str(folder / 'sporting_regulations.pdf'), generate_pages(20, 4, 0.2, 1))
+        processor = make_processor(InMemoryDatabase())
+        read_pages = processor.iter_pdf_pages
+
+        def failing_pages(pdf_path, *args, **kwargs):
+            for number, page in enumerate(read_pages(pdf_path, *args, **kwargs)):
+                if number == fail_after:
+                    raise error
+                yield page
+
+        if error is not None:
+            processor.iter_pdf_pages = failing_pages
+        return processor
+    return make
+
+
+def test_ingest_records_rules_and_skips_unchanged_files(tmp_path, ingest_processor):
+    processor = ingest_processor(tmp_path)
+    result = processor.process_documents(workers=1, raw_data_folder=str(tmp_path))
+    entry = processor.db.ingest_manifest.find_one({'file': 'sporting_regulations.pdf'})
+    assert entry['status'] == 'success' and len(entry['rule_ids']) == result['processed_files'][0]['rules_processed']
+    assert processor.process_documents(workers=1, raw_data_folder=str(tmp_path))['processed_files'] == []
+
+
+def test_transient_error_partway_leaves_the_file_to_be_retried(tmp_path, monkeypatch, ingest_processor):
+    # Small embedding batches, so rules from the pages before the failure reach the database
+    monkeypatch.setattr(datacollect, 'EMBEDDING_BATCH_SIZE', 2)
+    processor = ingest_processor(tmp_path, fail_after=2, error=OSError('read timed out'))
+    result = processor.process_documents(workers=1, raw_data_folder=str(tmp_path))
+    assert result['processed_files'][0]['retry'] is True
+    assert processor.db.rules.count_documents({}) > 0
+    assert processor.db.ingest_manifest.find_one({'file': 'sporting_regulations.pdf'}) is None
+
+    # The next run parses the whole file and records every rule, including those stored before the failure
+    processor.iter_pdf_pages = RuleBoxF1Processor.iter_pdf_pages.__get__(processor)
+    processor.process_documents(workers=1, raw_data_folder=str(tmp_path))
+    entry = processor.db.ingest_manifest.find_one({'file': 'sporting_regulations.pdf'})
+    assert entry['status'] == 'success'
+    assert sorted(entry['rule_ids']) == sorted(rule['rule_id'] for rule in processor.db.rules.find({}))
+
+
+def test_parse_error_partway_keeps_the_stored_rule_ids(tmp_path, monkeypatch, ingest_processor):
+    monkeypatch.setattr(datacollect, 'EMBEDDING_BATCH_SIZE', 2)
+    processor = ingest_processor(tmp_path, fail_after=2, error=PdfReadError('corrupt xref'))
+    result = processor.process_documents(workers=1, raw_data_folder=str(tmp_path))
+    assert result['processed_files'][0]['retry'] is False
+    entry = processor.db.ingest_manifest.find_one({'file': 'sporting_regulations.pdf'})
+    stored = sorted(rule['rule_id'] for rule in processor.db.rules.find({}))
+    assert entry['status'] == 'error' and stored and sorted(entry['rule_ids']) == stored
+
+
+def test_parallel_ingest_clamps_workers_and_spawns(tmp_path, monkeypatch, ingest_processor):
+    pools = []
+
+    class RecordingPool(datacollect.ProcessPoolExecutor):
+        def __init__(self, max_workers=None, mp_context=None):
+            pools.append((max_workers, mp_context.get_start_method()))
+            super().__init__(max_workers=max_workers, mp_context=mp_context)
+
+    monkeypatch.setattr(datacollect, 'ProcessPoolExecutor', RecordingPool)
+    monkeypatch.setattr(datacollect, 'MAX_INGEST_WORKERS', 2)
+    processor = ingest_processor(tmp_path)
+    result = processor.process_documents(workers=5000, raw_data_folder=str(tmp_path))
+    assert pools == [(2, 'spawn')]
+    (tmp_path / 'sequential').mkdir()
+    sequential = ingest_processor(tmp_path / 'sequential')
+    expected = sequential.process_documents(workers=1, raw_data_folder=str(tmp_path / 'sequential'))
+    assert result['processed_files'][0]['rules_processed'] == expected['processed_files'][0]['rules_processed'] > 0
+
+
+def test_files_whose_rules_were_dropped_are_ingested_again(tmp_path, ingest_processor):
+    processor = ingest_processor(tmp_path)
+    processor.process_documents(workers=1, raw_data_folder=str(tmp_path))
+    stored = processor.db.rules.count_documents({})
+    processor.db.rules.delete_many({})
+
+    result = processor.process_documents(workers=1, raw_data_folder=str(tmp_path))
+    assert [entry['status'] for entry in result['processed_files']] == ['success']
+    assert processor.db.rules.count_documents({}) == stored
+
+
+def test_store_skips_rules_whose_content_hash_is_unchanged(make_processor, make_rules):
+    processor = make_processor(InMemoryDatabase())
+    rules = make_rules(2)
+    counts = processor.store_in_database(copy.deepcopy(rules), batch_size=5)
+    assert counts == {'inserted': 12, 'updated': 0, 'unchanged': 0, 'errors': 0}
+
+    edited = copy.deepcopy(rules)
+    edited[0]['content'] += ' Amended.'
+    # Volatile metadata is left out of the hash
+    edited[1]['metadata']['last_modified'] = '2024-03-01'
+    counts = processor.store_in_database(edited, batch_size=5)
+    assert counts == {'inserted': 0, 'updated': 1, 'unchanged': 11, 'errors': 0}
+    stored = processor.db.rules.find_one({'rule_id': rules[0]['rule_id']})
+    assert stored['content'].endswith('Amended.') and stored['metadata']['content_hash']
+
+
+def test_bounded_applies_back_pressure_and_forwards_errors():
+    produced = []
+
+    def pages():
+        for number in range(100):
+            produced.append(number)
+            yield number
+        raise ValueError('truncated file')
+
+    items = datacollect._bounded(pages(), maxsize=3)
+    assert next(items) == 0
+    time.sleep(0.2)
+    # One item handed over, three queued and at most one waiting on the full queue
+    assert len(produced) <= 5
+    assert list(itertools.islice(items, 99)) == list(range(1, 100))
+    with pytest.raises(ValueError, match='truncated file'):
+        next(items)
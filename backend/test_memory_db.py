@@ -0,0 +1,46 @@
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateOne
+
+from benchmarks.memory_db import InMemoryCollection
+
+
+def rule(rule_id, category='sporting', content='text'):
+    return {'rule_id': rule_id, 'category': category, 'content': content, 'metadata': {'content_hash': content}}
+
+
+def test_bulk_write_uses_pymongo_operations():
+    rules = InMemoryCollection()
+    result = rules.bulk_write([ReplaceOne({'rule_id': 'a'}, rule('a'), upsert=True),
+                               ReplaceOne({'rule_id': 'b'}, rule('b'), upsert=True)])
+    assert result.upserted_count == 2 and set(result.upserted_ids) == {0, 1}
+    result = rules.bulk_write([
+        ReplaceOne({'rule_id': 'a'}, rule('a', content='new'), upsert=True),
+        UpdateOne({'rule_id': 'b'}, {'$set': {'metadata.ai_summary': 'short'}}),
+        InsertOne(rule('c')),
+        DeleteOne({'rule_id': 'c'})
+    ])
+    assert (result.modified_count, result.upserted_count, result.inserted_count, result.deleted_count) == (2, 0, 1, 1)
+    assert rules.find_one({'rule_id': 'a'})['content'] == 'new'
+    assert rules.find_one({'rule_id': 'b'})['metadata'] == {'content_hash': 'text', 'ai_summary': 'short'}
+    assert rules.count_documents({}) == 2
+
+
+def test_projections_and_copies():
+    rules = InMemoryCollection()
+    rules.replace_one({'rule_id': 'a'}, rule('a'), upsert=True)
+    included = rules.find_one({'rule_id': 'a'}, {'rule_id': 1, 'metadata.content_hash': 1})
+    assert set(included) == {'_id', 'rule_id', 'metadata'} and included['metadata'] == {'content_hash': 'text'}
+    excluded = rules.find_one({}, {'metadata.content_hash': 0})
+    assert excluded['metadata'] == {} and excluded['content'] == 'text'
+    excluded['content'] = 'changed'
+    assert rules.find_one({'rule_id': 'a'})['content'] == 'text'
+
+
+def test_rule_id_index_follows_updates_and_deletes():
+    rules = InMemoryCollection()
+    for rule_id in ('a', 'b', 'c'):
+        rules.replace_one({'rule_id': rule_id}, rule(rule_id), upsert=True)
+    rules.update_one({'rule_id': 'a'}, {'$set': {'rule_id': 'z'}})
+    assert rules.find_one({'rule_id': 'a'}) is None and rules.find_one({'rule_id': 'z'})
+    ids = [doc['_id'] for doc in rules.find({'rule_id': {'$in': ['b', 'z']}})]
+    assert rules.delete_many({'_id': {'$in': ids}}).deleted_count == 2
+    assert [doc['rule_id'] for doc in rules.find({'rule_id': {'$nin': []}})] == ['c']
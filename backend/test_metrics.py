@@ -0,0 +1,81 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import metrics
+from metrics import Counter, Histogram, Registry
+
+
+def test_counter_and_histogram_render_prometheus_text():
+    registry = Registry()
+    requests = registry.register(Counter('test_requests_total', 'Requests.', ('cache', 'result')))
+    latency = registry.register(Histogram('test_seconds', 'Latency.', ('stage',), buckets=(0.1, 1.0)))
+    requests.inc(cache='search', result='hit')
+    requests.inc(2, cache='search', result='hit')
+    for seconds in (0.05, 0.5, 5.0):
+        latency.observe(seconds, stage='llm')
+    registry.add_collector(lambda: [('test_entries', 'gauge', 'Entries.', [({'cache': 'search'}, 7)])])
+    lines = registry.render().splitlines()
+    assert 'test_requests_total{cache="search",result="hit"} 3' in lines
+    assert 'test_seconds_bucket{stage="llm",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="llm",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{stage="llm",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{stage="llm"} 5.55' in lines
+    assert 'test_seconds_count{stage="llm"} 3' in lines
+    assert '# TYPE test_entries gauge' in lines and 'test_entries{cache="search"} 7' in lines
+
+
+def test_label_values_are_escaped():
+    counter = Counter('test_total', 'Escapes.', ('route',))
+    counter.inc(route='a"b\\c\nd')
+    assert counter.render()[-1] == 'test_total{route="a\\"b\\\\c\\nd"} 1'
+
+
+def test_failing_collector_does_not_break_the_scrape():
+    registry = Registry()
+
+    def broken():
+        raise RuntimeError('stats unavailable')
+    registry.add_collector(broken)
+    registry.register(Counter('test_total', 'Still rendered.'))
+    assert '# TYPE test_total counter' in registry.render()
+
+
+def stage_count(name):
+    counts, _ = metrics.STAGE_SECONDS._values.get((name,), ([0], 0.0))
+    return sum(counts)
+
+
+def test_stage_times_blocks_and_counts_errors():
+    before = stage_count('test_stage')
+    with metrics.stage('test_stage'):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.stage('test_stage'):
+            raise ValueError('boom')
+    assert stage_count('test_stage') == before + 2
+    assert metrics.STAGE_ERRORS._values[('test_stage',)] >= 1
+
+
+def test_middleware_labels_requests_by_route_template():
+    app = FastAPI()
+
+    @app.get('/items/{item_id}')
+    async def item(item_id: int):
+        return {'id': item_id}
+
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+            assert (await client.get('/items/1')).status_code == 200
+            assert (await client.get('/items/2')).status_code == 200
+            assert (await client.get('/nowhere')).status_code == 404
+
+    asyncio.run(run())
+    values = metrics.HTTP_REQUEST_SECONDS._values
+    assert sum(values[('GET', '/items/{item_id}', 200)][0]) >= 2
+    assert ('GET', '/nowhere', 404) not in values
+    assert sum(values[('GET', 'unmatched', 404)][0]) >= 1
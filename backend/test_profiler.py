@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from profiler import ProfilerMiddleware, SamplingProfiler
+
+
+def test_stop_releases_the_profiled_tasks():
+    profiler = SamplingProfiler(interval=0.001)
+
+    async def request():
+        profile = profiler.start('GET', '/api/search', 'header')
+        child = asyncio.create_task(asyncio.sleep(0.01))
+        await child
+        assert len(profile.tasks) == 2
+        profiler.stop(profile, 200)
+        return profile
+
+    profile = asyncio.run(request())
+    assert profile.tasks == [] and profiler._task_profiles == {}
+    assert profiler.get(profile.id) is profile
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def make_app(profiler, admins=('operator',)):
+    app = FastAPI()
+
+    @app.get('/work')
+    async def work():
+        busy(0.05)
+        return {'ok': True}
+
+    @app.get('/api/profiles')
+    async def profiles():
+        return {}
+
+    async def authorize(scope):
+        return dict(scope['headers']).get(b'x-user', b'').decode() in admins
+
+    app.add_middleware(ProfilerMiddleware, profiler=profiler, authorize=authorize, skip_prefixes=('/api/profiles',))
+    return app
+
+
+def request(app, path, headers=None):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+            return await client.get(path, headers=headers)
+    return asyncio.run(run())
+
+
+def test_admin_header_profiles_the_request():
+    profiler = SamplingProfiler(interval=0.001)
+    response = request(make_app(profiler), '/work', {'X-Profile': '1', 'X-User': 'operator'})
+    profile = profiler.get(int(response.headers['x-profile-id']))
+    assert profile.status == 200 and profile.reason == 'header' and profile.samples > 0
+    assert 'work (test_profiler.py' in profile.folded()
+    assert profile.folded() in profiler.merged_folded('/work')
+
+
+def test_header_from_a_non_admin_or_to_skipped_paths_is_ignored():
+    profiler = SamplingProfiler(interval=0.001)
+    app = make_app(profiler)
+    assert 'x-profile-id' not in request(app, '/work', {'X-Profile': '1', 'X-User': 'mallory'}).headers
+    assert 'x-profile-id' not in request(app, '/api/profiles', {'X-Profile': '1', 'X-User': 'operator'}).headers
+    assert profiler.summaries() == []
+
+
+def test_sampled_requests_are_kept_without_a_header():
+    profiler = SamplingProfiler(interval=0.001, max_profiles=2, sample_rate=1.0)
+    app = make_app(profiler)
+    for _ in range(3):
+        response = request(app, '/work')
+        assert 'x-profile-id' not in response.headers
+    summaries = profiler.summaries()
+    assert len(summaries) == 2 and all(summary['reason'] == 'sampled' for summary in summaries)
+    assert summaries[0]['id'] > summaries[1]['id']
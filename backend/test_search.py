@@ -0,0 +1,61 @@
+import copy
+import threading
+
+from search_index import BM25Index
+from vector_index import HashingEmbedder, VectorIndex
+
+
+def test_bm25_ranks_matching_rules_first(make_rules):
+    index = BM25Index.from_rules(make_rules())
+    results = index.search('safety car deployed', limit=3)
+    assert results and all(rule['rule_id'].startswith('safety car') for rule in results)
+    assert index.search('marketing', category_filter='Sporting') == []
+
+
+def test_vector_index_scores_are_cosines(make_rules):
+    embedder = HashingEmbedder()
+    rules = make_rules(1)
+    index = VectorIndex(embedder.encode_batch([rule['content'] for rule in rules]), [r['category'] for r in rules])
+    doc_id, score = index.top(embedder.encode(rules[3]['content']), limit=1)[0]
+    assert doc_id == 3 and abs(score - 1.0) < 1e-5
+    assert all(index.categories[i] == 'financial' for i, _ in index.top(embedder.encode('cost'), 5, 'Financial'))
+
+
+def test_hybrid_search_fuses_lexical_and_dense_rankings(make_processor, make_rules):
+    processor = make_processor(rules=make_rules())
+    results = processor.semantic_search('black flag disqualified', limit=5)
+    assert len(results) == 5
+    assert results[0]['rule_id'].startswith('black flag')
+    assert all(rule['score'] > 0 for rule in results)
+
+
+def test_hybrid_search_without_lexical_match_returns_nothing(make_processor, make_rules):
+    processor = make_processor(rules=make_rules())
+    query = 'xyzzy qwerty'
+    # Hash collisions give the nonsense query positive cosines against some rules ...
+    assert processor.vector_index.top(processor.embedding_model.encode(query), 10)
+    # ... but with no BM25 match there must be no results
+    assert processor.search_index.top(query) == []
+    assert processor.semantic_search(query) == []
+
+
+def test_search_during_index_rebuild_uses_one_consistent_build(make_processor, make_rules):
+    large, small = make_rules(8), make_rules(1)
+    processor = make_processor(rules=large)
+    stop = threading.Event()
+
+    def rebuild():
+        while not stop.is_set():
+            for rules in (small, large):
+                processor._build_indexes(copy.deepcopy(rules))
+
+    thread = threading.Thread(target=rebuild)
+    thread.start()
+    try:
+        for _ in range(300):
+            # Raises IndexError if the dense matrix of one build meets the documents of another
+            processor.vector_search('rear wing reference volume', limit=48)
+            assert processor._hybrid_search('black flag', 5, None)[0]['rule_id'].startswith('black flag')
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_task():
+    flight = SingleFlight()
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return {'key': key}
+
+    async def run():
+        return await asyncio.gather(*(flight.do(key, lambda key=key: work(key)) for key in ('a', 'a', 'a', 'b')))
+
+    results = asyncio.run(run())
+    assert sorted(calls) == ['a', 'b']
+    assert results[0] is results[1] is results[2]
+    assert flight.stats() == {'calls': 4, 'upstream_calls': 2, 'coalesced': 2, 'coalesce_rate': 0.5, 'in_flight': 0}
+
+
+def test_exceptions_are_shared_and_the_key_is_released():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('upstream down')
+
+    async def run():
+        results = await asyncio.gather(flight.do('k', fail), flight.do('k', fail), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        return await flight.do('k', lambda: asyncio.sleep(0, result='recovered'))
+
+    assert asyncio.run(run()) == 'recovered'
+    assert flight.leaders == 2
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_work():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return 'done'
+
+    async def run():
+        first = asyncio.create_task(flight.do('k', work))
+        second = asyncio.create_task(flight.do('k', work))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == 'done'
+
+
+def test_the_work_is_cancelled_when_every_caller_is():
+    flight = SingleFlight()
+    started = []
+
+    async def work():
+        started.append(True)
+        await asyncio.sleep(1)
+        return 'done'
+
+    async def run():
+        callers = [asyncio.create_task(flight.do('k', work)) for _ in range(2)]
+        await asyncio.sleep(0.005)
+        task = flight._inflight['k']
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        return task
+
+    task = asyncio.run(run())
+    assert started == [True]
+    assert task.cancelled()
+    assert flight.stats()['in_flight'] == 0
@@ -0,0 +1,68 @@
+import math
+import zlib
+
+import numpy as np
+
+from search_index import tokenize
+
+EMBEDDING_DIM = 256
+
+
+class HashingEmbedder:
+    """CPU-only text embedder using signed feature hashing of word uni- and bigrams"""
+
+    def __init__(self, dim=EMBEDDING_DIM):
+        self.dim = dim
+
+    def _features(self, text):
+        tokens = tokenize(text)
+        features = {}
+        for token in tokens:
+            features[token] = features.get(token, 0) + 1
+        for first, second in zip(tokens, tokens[1:]):
+            bigram = f"{first} {second}"
+            features[bigram] = features.get(bigram, 0) + 1
+        return features
+
+    def _fill(self, row, text):
+        for feature, count in self._features(text).items():
+            # crc32 is stable across processes, unlike hash(), so stored vectors stay comparable
+            digest = zlib.crc32(feature.encode('utf-8'))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            row[digest % self.dim] += sign * (1.0 + math.log(count))
+
+    def encode(self, text):
+        return self.encode_batch([text])[0]
+
+    def encode_batch(self, texts):
+        """Embed texts into an (n, dim) float32 matrix of L2-normalised rows"""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in zip(matrix, texts):
+            self._fill(row, text)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+        return matrix
+
+
+class VectorIndex:
+    """Dense cosine-similarity index backed by one contiguous float32 matrix"""
+
+    def __init__(self, matrix, categories):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.categories = np.array([str(c).lower() for c in categories])
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def top(self, query_vector, limit=10, category_filter=None):
+        """Return the best (doc_id, score) pairs for a query vector"""
+        if not len(self) or limit <= 0:
+            return []
+        scores = self.matrix @ np.asarray(query_vector, dtype=np.float32)
+        if category_filter:
+            scores = np.where(self.categories == category_filter.lower(), scores, -np.inf)
+        k = min(limit, scores.shape[0])
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(int(i), float(scores[i])) for i in candidates if scores[i] > 0]